@@ -0,0 +1,80 @@
+"""Compares contact import rates: one create_contact per row vs bulk import.
+
+Runs against a throwaway SQLite database, so no Postgres is needed, but
+the usual ``.env`` must be in place for the settings. From the project
+root::
+
+    python -m benchmarks.contacts_import [rows]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.database.models import Base, User
+from src.repository import contacts as repo_contacts
+from src.schemas.contacts import ContactModel
+from src.services.contacts_import import import_contacts
+
+ROWS = 20_000
+CHUNK = 64 * 1024
+
+
+def make_csv(rows: int) -> bytes:
+    lines = ["first_name,last_name,phone,email,birthday"]
+    for i in range(rows):
+        lines.append(
+            f"Name{i},Surname{i},+38093{i:07d},user{i}@example.com,"
+            f"19{i % 100:02d}-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def chunks(body: bytes):
+    for start in range(0, len(body), CHUNK):
+        yield body[start:start + CHUNK]
+
+
+async def run(rows: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    body = make_csv(rows)
+
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", password="x")
+        db.add(user)
+        await db.commit()
+
+        # per-row inserts are slow, time a sample and extrapolate
+        sample = min(rows, 1000)
+        bodies = [
+            ContactModel(
+                first_name=f"Single{i}",
+                last_name="Row",
+                phone=f"+38093{i:07d}",
+            )
+            for i in range(sample)
+        ]
+        start = time.perf_counter()
+        for contact in bodies:
+            await repo_contacts.create_contact(contact, user, db)
+        single = sample / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        report = await import_contacts(chunks(body), "text/csv", user, db)
+        bulk = report.created / (time.perf_counter() - start)
+    await engine.dispose()
+
+    print(f"{'method':<20}{'rows':>8}{'rows/s':>12}")
+    print(f"{'create_contact':<20}{sample:>8}{single:>12.0f}")
+    print(f"{'import_contacts':<20}{report.created:>8}{bulk:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS))
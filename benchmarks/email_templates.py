@@ -0,0 +1,56 @@
+"""Render-only cost of the confirmation email.
+
+Compares what fastapi_mail did for every message (a fresh Jinja
+environment loading and compiling the template), a cached Jinja template
+and the static-parts path of ``TemplateRegistry``. No token is created
+and nothing is sent. Run from the project root with the usual ``.env``
+in place::
+
+    python -m benchmarks.email_templates
+"""
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+from src.services.email import TEMPLATE_FOLDER, TemplateRegistry
+
+NAME = "email_template.html"
+ROUNDS = 2000
+CONTEXT = {
+    "host": "http://localhost:8000/",
+    "username": "deadpool",
+    "token": "header.payload.signature",
+}
+
+
+def per_message_environment() -> str:
+    environment = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER))
+    return environment.get_template(NAME).render(CONTEXT)
+
+
+def timed(render) -> float:
+    render()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        render()
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    registry = TemplateRegistry(TEMPLATE_FOLDER)
+    registry.load()
+    template = registry.environment.get_template(NAME)
+    renderers = {
+        "environment per message": per_message_environment,
+        "cached jinja template": lambda: template.render(CONTEXT),
+        "TemplateRegistry": lambda: registry.render(NAME, **CONTEXT),
+    }
+    assert renderers["TemplateRegistry"]() == template.render(CONTEXT)
+
+    print(f"{'renderer':<26}{'us/render':>12}")
+    for name, render in renderers.items():
+        print(f"{name:<26}{timed(render) * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
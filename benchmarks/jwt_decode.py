@@ -0,0 +1,53 @@
+"""Access token decode throughput on one core.
+
+Compares python-jose, PyJWT (if installed) and the cached
+``Auth.decode_token``. Run from the project root with the usual ``.env``
+in place::
+
+    python -m benchmarks.jwt_decode
+"""
+import asyncio
+import time
+
+from jose import jwt
+
+from src.services.auth import auth_service
+
+SECONDS = 1.0
+
+
+def throughput(decode) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        for _ in range(100):
+            decode()
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+async def main():
+    token = await auth_service.create_access_token(
+        data={"sub": "deadpool@example.com"}
+    )
+    key, algorithm = auth_service.SECRET_KEY, auth_service.ALGORITHM
+    decoders = {
+        "python-jose": lambda: jwt.decode(token, key, algorithms=[algorithm]),
+    }
+    try:
+        import jwt as pyjwt
+    except ImportError:
+        pass
+    else:
+        decoders[f"PyJWT {pyjwt.__version__}"] = lambda: pyjwt.decode(
+            token, key, algorithms=[algorithm]
+        )
+    decoders["Auth.decode_token"] = lambda: auth_service.decode_token(token)
+
+    print(f"{'decoder':<22}{'decodes/s':>12}")
+    for name, decode in decoders.items():
+        print(f"{name:<22}{throughput(decode):>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""Measures serialization cost of a list_contacts response.
+
+Compares FastAPI's response_model path (ResponseContact validation,
+jsonable_encoder, stdlib JSON) with the orjson fast path used by the
+contact read routes. No database is involved, the contacts are built in
+memory. Run from the project root with the usual ``.env`` in place::
+
+    python -m benchmarks.list_contacts
+"""
+import asyncio
+import time
+from datetime import date
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.database.models import Contact
+from src.schemas.contacts import ResponseContact, dump_contact
+
+LIMITS = (100, 1000)
+ROUNDS = 50
+
+
+def make_contacts(count: int) -> list[Contact]:
+    return [
+        Contact(
+            id=i,
+            first_name=f"Name{i}",
+            last_name=f"Surname{i}",
+            phone=f"tel:+380-93-{i % 1000:03d}-{i % 10000:04d}",
+            email=f"user{i}@example.com",
+            birthday=date(1990, i % 12 + 1, i % 28 + 1),
+            user_id=1,
+            version=1,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+async def response_model_path(field, contacts) -> bytes:
+    content = await serialize_response(field=field, response_content=contacts)
+    return JSONResponse(content).body
+
+
+async def fast_path(field, contacts) -> bytes:
+    return ORJSONResponse([dump_contact(c) for c in contacts]).body
+
+
+async def timed(serializer, field, contacts) -> tuple[float, bytes]:
+    body = await serializer(field, contacts)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await serializer(field, contacts)
+    return (time.perf_counter() - start) / ROUNDS, body
+
+
+async def main():
+    field = create_response_field(
+        name="Response_list_contacts", type_=list[ResponseContact]
+    )
+    print(f"{'limit':>6}{'response_model ms':>20}{'fast path ms':>15}")
+    for limit in LIMITS:
+        contacts = make_contacts(limit)
+        before, slow_body = await timed(response_model_path, field, contacts)
+        after, fast_body = await timed(fast_path, field, contacts)
+        assert orjson.loads(slow_body) == orjson.loads(fast_body)
+        print(f"{limit:>6}{before * 1e3:>20.2f}{after * 1e3:>15.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
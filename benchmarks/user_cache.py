@@ -0,0 +1,42 @@
+"""Compares auth cache entries: pickled ORM ``User`` vs serialized Principal.
+
+Run from the project root with the usual ``.env`` in place::
+
+    python -m benchmarks.user_cache
+"""
+import pickle
+import timeit
+from datetime import datetime
+
+from src.database.models import User
+from src.schemas.users import Principal
+from src.services.cache import dumps_principal, loads_principal
+
+NUMBER = 100_000
+
+
+def main():
+    user = User(
+        id=42,
+        username="deadpool",
+        email="deadpool@example.com",
+        password="$2b$12$" + "x" * 53,
+        created_at=datetime.now(),
+        avatar="https://www.gravatar.com/avatar/"
+        "3c5d6e3a0b9a0c1bbd6c1f3e1f2e4f7a?d=robohash",
+        refresh_token="x" * 180,
+        confirmed=True,
+    )
+    principal = Principal.from_user(user)
+    entries = {
+        "pickle(User)": (pickle.dumps(user), pickle.loads),
+        "orjson(Principal)": (dumps_principal(principal), loads_principal),
+    }
+    print(f"{'format':<20}{'bytes':>8}{'decode us':>12}")
+    for name, (data, loads) in entries.items():
+        seconds = timeit.timeit(lambda: loads(data), number=NUMBER)
+        print(f"{name:<20}{len(data):>8}{seconds / NUMBER * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,25 @@
+import asyncio
+
 import redis.asyncio as redis
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_limiter import FastAPILimiter
 
 from src.api.router import router
 from src.conf.config import settings
+from src.services import birthdays
+from src.services.cache import (
+    birthday_cache,
+    contact_cache,
+    email_request_dedup,
+    signup_idempotency,
+    token_revocations,
+    user_cache,
+)
+from src.services.email import email_queue
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.include_router(router, prefix='/api')
 
@@ -25,11 +38,43 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup():
+    # One async pool per worker, shared by the rate limiter and the caches.
+    # Responses stay raw bytes because the caches store binary.
     r = redis.Redis(
         host=settings.redis_host,
         port=settings.redis_port,
         db=0,
-        encoding="utf-8",
-        decode_responses=True
     )
     await FastAPILimiter.init(r)
+    user_cache.r = birthday_cache.r = contact_cache.r = r
+    if settings.contact_cache_redis_host:
+        # evicting instance, apart from revocations and idempotency keys
+        contact_cache.r = redis.Redis(
+            host=settings.contact_cache_redis_host,
+            port=settings.contact_cache_redis_port,
+            db=0,
+        )
+    token_revocations.r = email_queue.r = r
+    signup_idempotency.r = email_request_dedup.r = r
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen())
+    if settings.stateless_access_tokens:
+        app.state.revocation_listener = asyncio.create_task(
+            token_revocations.listen()
+        )
+    if settings.birthday_digest_schedule:
+        app.state.birthday_digest = asyncio.create_task(birthdays.run_daily())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.user_cache_listener.cancel()
+    if settings.stateless_access_tokens:
+        app.state.revocation_listener.cancel()
+    if settings.birthday_digest_schedule:
+        app.state.birthday_digest.cancel()
+    if settings.contact_cache_redis_host:
+        await contact_cache.r.close()
+    user_cache.r = birthday_cache.r = contact_cache.r = None
+    token_revocations.r = email_queue.r = None
+    signup_idempotency.r = email_request_dedup.r = None
+    await FastAPILimiter.close()
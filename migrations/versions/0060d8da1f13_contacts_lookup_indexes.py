@@ -0,0 +1,36 @@
+"""Composite lookup indexes on contacts by owner
+
+Revision ID: 0060d8da1f13
+Revises: 6bddd78c52b9
+Create Date: 2026-10-18 18:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0060d8da1f13'
+down_revision: Union[str, None] = '6bddd78c52b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (user_id, id) already exists as ix_contacts_user_id_id
+    op.create_index(
+        'ix_contacts_user_id_last_name_first_name', 'contacts',
+        ['user_id', 'last_name', 'first_name'], unique=False,
+    )
+    op.create_index(
+        'ix_contacts_user_id_lower_email', 'contacts',
+        ['user_id', sa.text('lower(email)')], unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_lower_email', table_name='contacts')
+    op.drop_index(
+        'ix_contacts_user_id_last_name_first_name', table_name='contacts'
+    )
@@ -0,0 +1,42 @@
+"""Indexed birthday month-day column on contacts
+
+Revision ID: 6bddd78c52b9
+Revises: c98c7ff8dcad
+Create Date: 2026-10-18 17:02:53.804417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '6bddd78c52b9'
+down_revision: Union[str, None] = 'c98c7ff8dcad'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTH_DAY = {
+    'postgresql': 'CAST(EXTRACT(MONTH FROM birthday) * 100'
+                  ' + EXTRACT(DAY FROM birthday) AS INTEGER)',
+    'sqlite': "CAST(strftime('%m%d', birthday) AS INTEGER)",
+}
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    # SQLite can only add virtual generated columns to an existing table
+    op.add_column('contacts', sa.Column(
+        'birthday_md', sa.Integer(),
+        sa.Computed(MONTH_DAY[dialect], persisted=dialect != 'sqlite'),
+        nullable=True,
+    ))
+    op.create_index(
+        'ix_contacts_user_id_birthday_md', 'contacts',
+        ['user_id', 'birthday_md'], unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts')
+    op.drop_column('contacts', 'birthday_md')
@@ -0,0 +1,27 @@
+"""Row version on contacts for ETags
+
+Revision ID: a20e11809b17
+Revises: 0060d8da1f13
+Create Date: 2026-10-18 18:40:21.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a20e11809b17'
+down_revision: Union[str, None] = '0060d8da1f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column(
+        'version', sa.Integer(), server_default='1', nullable=False
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('contacts', 'version')
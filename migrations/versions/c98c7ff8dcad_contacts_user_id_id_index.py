@@ -0,0 +1,27 @@
+"""Composite index for keyset pagination of contacts
+
+Revision ID: c98c7ff8dcad
+Revises: ffa8b296d025
+Create Date: 2026-10-18 16:41:07.530219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c98c7ff8dcad'
+down_revision: Union[str, None] = 'ffa8b296d025'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,27 @@
+"""Token version on users for stateless access tokens
+
+Revision ID: f01c2fbcc0b4
+Revises: a20e11809b17
+Create Date: 2026-10-18 19:31:52.217730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f01c2fbcc0b4'
+down_revision: Union[str, None] = 'a20e11809b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column(
+        'token_version', sa.Integer(), server_default='0', nullable=False
+    ))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
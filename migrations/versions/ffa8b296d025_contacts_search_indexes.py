@@ -0,0 +1,45 @@
+"""Trigram indexes for contact search
+
+Revision ID: ffa8b296d025
+Revises: 3ecc3880eac0
+Create Date: 2026-10-18 16:20:41.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'ffa8b296d025'
+down_revision: Union[str, None] = '3ecc3880eac0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRGM_COLUMNS = ('first_name', 'last_name', 'email')
+
+
+def upgrade() -> None:
+    # pg_trgm only exists on Postgres, SQLite search uses plain LIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in TRGM_COLUMNS:
+        op.create_index(
+            f'ix_contacts_{column}_trgm', 'contacts', [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+        )
+    op.create_index(
+        'ix_contacts_phone_digits_trgm', 'contacts',
+        [sa.text("replace(replace(phone, 'tel:', ''), '-', '') gin_trgm_ops")],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_contacts_phone_digits_trgm', table_name='contacts')
+    for column in TRGM_COLUMNS:
+        op.drop_index(f'ix_contacts_{column}_trgm', table_name='contacts')
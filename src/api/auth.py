@@ -1,7 +1,11 @@
+import hashlib
+import logging
+
+import orjson
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Depends,
+    Header,
     HTTPException,
     Request,
     Security,
@@ -12,36 +16,71 @@ from fastapi.security import (
     HTTPBearer,
     OAuth2PasswordRequestForm,
 )
-from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
 from src.schemas.tokens import TokenModel
-from src.schemas.users import RequestEmail, UserModel, UserResponse
+from src.schemas.users import Principal, RequestEmail, UserModel, UserResponse
 from src.services.auth import auth_service
+from src.services.cache import PENDING, email_request_dedup, signup_idempotency
 from src.services.email import send_email
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks,
-                 request: Request, db: Session = Depends(get_db)):
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
-                            detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(
-        send_email, new_user.email, new_user.username, request.base_url)
-    return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
+async def signup(body: UserModel, request: Request,
+                 db: AsyncSession = Depends(get_db),
+                 idempotency_key: str | None = Header(default=None)):
+    async def create_account():
+        exist_user = await repository_users.get_user_by_email(body.email, db)
+        if exist_user:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Account already exists")
+        body.password = await auth_service.get_password_hash(body.password)
+        new_user = await repository_users.create_user(body, db)
+        try:
+            await send_email(
+                new_user.email, new_user.username, request.base_url)
+        except RedisError:
+            # the account exists, the email can be requested again
+            logger.exception("Could not queue the confirmation email")
+        response = UserResponse(
+            user=new_user,
+            detail="User successfully created. Check your email for confirmation.")
+        return response.model_dump(mode="json")
+
+    if not idempotency_key:
+        return await create_account()
+    # retries with the same key get the first response, no second
+    # password hash, insert or email; keys are scoped to the email and
+    # bound to the whole body, password included
+    fingerprint = hashlib.sha256(
+        orjson.dumps(body.model_dump(), option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    try:
+        result = await signup_idempotency.run(
+            f"{body.email.lower()}:{idempotency_key}", create_account,
+            fingerprint=fingerprint)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was used for a different request")
+    if result is PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is in progress")
+    return result
 
 
 @router.post("/login", response_model=TokenModel)
 async def login(body: OAuth2PasswordRequestForm = Depends(),
-                db: Session = Depends(get_db)):
+                db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(
@@ -49,34 +88,44 @@ async def login(body: OAuth2PasswordRequestForm = Depends(),
     if not user.confirmed:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
+    access_token = await auth_service.create_access_token(
+        data={"sub": user.email, **auth_service.principal_claims(user)})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
     user = await repository_users.get_user_by_email(email, db)
     if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+        # a reused refresh token may be stolen, sign the user out everywhere
+        await repository_users.revoke_tokens(user, db)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(
+        data={"sub": email, **auth_service.principal_claims(user)})
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post('/logout')
+async def logout(current_user: Principal = Depends(auth_service.get_current_user),
+                 db: AsyncSession = Depends(get_db)):
+    await repository_users.revoke_tokens(current_user, db)
+    return {"message": "Logged out"}
+
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     email = await auth_service.get_email_from_token(token)
     user = await repository_users.get_user_by_email(email, db)
     if user is None:
@@ -89,13 +138,25 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks,
-                        request: Request, db: Session = Depends(get_db)):
-    user = await repository_users.get_user_by_email(body.email, db)
+async def request_email(body: RequestEmail, request: Request,
+                        db: AsyncSession = Depends(get_db)):
+    async def request_confirmation():
+        user = await repository_users.get_user_by_email(body.email, db)
+        if user and user.confirmed:
+            return {"message": "Your email is already confirmed"}
+        if user:
+            try:
+                await send_email(user.email, user.username, request.base_url)
+            except RedisError:
+                # raised through the dedup, so a retry is not blocked
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Could not send the email, try again later")
+        return {"message": "Check your email for confirmation."}
 
-    if user.confirmed:
-        return {"message": "Your email is already confirmed"}
-    if user:
-        background_tasks.add_task(
-            send_email, user.email, user.username, request.base_url)
-    return {"message": "Check your email for confirmation."}
+    # repeats within the dedup window get the first answer, one email
+    result = await email_request_dedup.run(
+        body.email.lower(), request_confirmation)
+    if result is PENDING:
+        return {"message": "Check your email for confirmation."}
+    return result
@@ -1,11 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.conf.config import settings
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import contacts as repo_contacts
-from src.schemas.contacts import ContactModel, ResponseContact
+from src.schemas.contacts import (
+    ContactBatchDelete,
+    ContactBatchUpdate,
+    ContactModel,
+    ContactPage,
+    ContactPatch,
+    ImportReport,
+    ResponseContact,
+    dump_contact,
+)
+from src.services import birthdays, contacts_export, contacts_import, etag
 from src.services.auth import auth_service
 
 router = APIRouter(prefix="/contacts")
@@ -13,52 +36,92 @@ router = APIRouter(prefix="/contacts")
 RequestLimiter = Depends(RateLimiter(times=10, seconds=60))
 
 
+def if_match_versions(if_match: str | None) -> list[int] | None:
+    """Contact versions a write is conditional on, None for any version."""
+    if if_match is None or "*" in etag.parse_etags(if_match):
+        return None
+    return etag.parse_versions(if_match)
+
+
+async def raise_not_found(
+    contact_id: int,
+    versions: list[int] | None,
+    user: User,
+    db: AsyncSession,
+) -> None:
+    """Raises 412 if a conditional write missed an existing contact,
+    404 otherwise."""
+    if versions is not None:
+        version = await repo_contacts.get_contact_version(contact_id, user, db)
+        if version is not None:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Contact has been modified",
+                headers={"ETag": etag.contact_etag(version)},
+            )
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
+    )
+
+
 @router.get("/")
 async def list_contacts(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    first_name: str = None,
-    last_name: str = None,
-    email: str = None,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    first_name: str | None = None,
+    last_name: str | None = None,
+    email: str | None = None,
+    sort_by: Literal["id", "first_name", "last_name"] = "id",
+    cursor: str | None = None,
+    if_none_match: str | None = Header(default=None),
     current_user: User = Depends(auth_service.get_current_user),
-) -> list[ResponseContact] | ResponseContact:
+) -> list[ResponseContact] | ContactPage:
     """
     Retrieves a list of contacts from the database.
 
+    All given filters must match; filtering, sorting and pagination run as
+    a single query. Stored rows are serialized without revalidation.
+
     :param skip: The number of contacts to skip. Defaults to 0.
     :type skip: int
     :param limit: The maximum number of contacts to retrieve. Defaults to 100.
     :type limit: int
     :param db: The database session. Defaults to the result of the `get_db` function.
-    :type db: Session
+    :type db: AsyncSession
     :param first_name: The first name of the contacts to retrieve. Defaults to None.
-    :type first_name: str
+    :type first_name: str | None
     :param last_name: The last name of the contacts to retrieve. Defaults to None.
-    :type last_name: str
+    :type last_name: str | None
     :param email: The email of the contacts to retrieve. Defaults to None.
-    :type email: str
+    :type email: str | None
+    :param sort_by: The field to sort the contacts by. Defaults to "id".
+    :type sort_by: str
+    :param cursor: Switches to keyset pagination when given: an empty string for the first page, then the `next_cursor` of the previous page. Defaults to None.
+    :type cursor: str | None
+    :param if_none_match: ETag of the result the client already holds, answered with 304 if unchanged.
+    :type if_none_match: str | None
     :param current_user: The current authenticated user. Defaults to the result of the `get_current_user` function.
     :type current_user: User
 
-    :return: The list of contacts retrieved from the database.
-    :rtype: list[ResponseContact] | ResponseContact
+    :return: The list of contacts retrieved from the database, or a page of contacts with the cursor of the next page in keyset mode.
+    :rtype: list[ResponseContact] | ContactPage
 
-    :raises HTTPException: If there are no contacts in the database.
+    :raises HTTPException: If there are no contacts in the database or the cursor is invalid.
     """
-    contacts = await repo_contacts.get_contacts(skip, limit, current_user, db)
-
-    if first_name:
-        contacts = await repo_contacts.get_contact_by_first_name(
-            first_name, current_user, db
-        )
-    elif last_name:
-        contacts = await repo_contacts.get_contact_by_last_name(
-            last_name, current_user, db
-        )
-    elif email:
-        contacts = await repo_contacts.get_contact_by_email(
-            email, current_user, db
+    filters = dict(first_name=first_name, last_name=last_name, email=email)
+    if cursor is not None:
+        try:
+            contacts, next_cursor = await repo_contacts.get_contacts_page(
+                cursor, limit, current_user, db, **filters, sort_by=sort_by
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+            )
+    else:
+        contacts = await repo_contacts.get_contacts(
+            skip, limit, current_user, db, **filters, sort_by=sort_by
         )
 
     if not contacts:
@@ -67,7 +130,20 @@ async def list_contacts(
             detail="There is no contacts",
         )
 
-    return contacts
+    tag = etag.collection_etag(
+        ((contact.id, contact.version) for contact in contacts),
+        next_cursor if cursor is not None else None,
+    )
+    if etag.etag_matches(if_none_match, tag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag}
+        )
+    items = [dump_contact(contact) for contact in contacts]
+    if cursor is not None:
+        content = {"items": items, "next_cursor": next_cursor}
+    else:
+        content = items
+    return ORJSONResponse(content, headers={"ETag": tag})
 
 
 @router.post(
@@ -78,7 +154,7 @@ async def list_contacts(
 )
 async def create_contact(
     body: ContactModel,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -87,7 +163,7 @@ async def create_contact(
     :param body: The contact data to be created.
     :type body: ContactModel
     :param db: The database session. Defaults to Depends(get_db).
-    :type db: Session, optional
+    :type db: AsyncSession, optional
     :param current_user: The current user. Defaults to Depends(auth_service.get_current_user).
     :type current_user: User, optional
 
@@ -100,19 +176,150 @@ async def create_contact(
     return contact
 
 
+@router.post(
+    "/import",
+    response_model=ImportReport,
+    dependencies=[RequestLimiter],
+)
+async def import_contacts(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Imports contacts in bulk from a CSV or NDJSON request body.
+
+    The body is read as a stream and written in chunks of
+    `contacts_import_chunk_size` rows, each in its own transaction. CSV
+    bodies (`text/csv`) start with a header naming the contact fields,
+    NDJSON bodies (`application/x-ndjson`) hold one contact object per
+    line. Invalid rows are skipped and reported by line number.
+
+    :param request: The incoming request with the contacts as body.
+    :type request: Request
+    :param db: The database session. Defaults to Depends(get_db).
+    :type db: AsyncSession, optional
+    :param current_user: The current user. Defaults to Depends(auth_service.get_current_user).
+    :type current_user: User, optional
+
+    :return: The numbers of created and failed rows and the row errors.
+    :rtype: ImportReport
+
+    :raises HTTPException: If the media type is not supported, or the body is not UTF-8 or lacks a valid CSV header.
+    """
+    content_type = request.headers.get("content-type", "")
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type not in (
+        contacts_import.CSV_TYPES + contacts_import.NDJSON_TYPES
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected a text/csv or application/x-ndjson body",
+        )
+    try:
+        return await contacts_import.import_contacts(
+            request.stream(),
+            content_type,
+            current_user,
+            db,
+            chunk_size=settings.contacts_import_chunk_size,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+
+
+@router.get("/export", dependencies=[RequestLimiter])
+async def export_contacts(
+    format: Literal["ndjson", "csv", "vcard"] = "ndjson",
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Streams all contacts of the current user as a file download.
+
+    Rows are read over a server-side cursor and written out chunk by
+    chunk, so memory use does not depend on the number of contacts.
+
+    :param format: The file format, "ndjson", "csv" or "vcard". Defaults to "ndjson".
+    :type format: str
+    :param db: The database session. Defaults to Depends(get_db).
+    :type db: AsyncSession, optional
+    :param current_user: The current user. Defaults to Depends(auth_service.get_current_user).
+    :type current_user: User, optional
+
+    :return: The contacts in the requested format.
+    :rtype: StreamingResponse
+    """
+    serializer, media_type, extension = contacts_export.FORMATS[format]
+    chunks = repo_contacts.stream_contacts(current_user, db)
+    return StreamingResponse(
+        serializer(chunks),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="contacts.{extension}"'
+            )
+        },
+    )
+
+
+@router.get("/search", response_model=list[ResponseContact])
+async def search_contacts(
+    q: str = Query(min_length=1, max_length=100),
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Searches contacts by the beginning of the first name, last name or
+    email, or by digits of the phone number. On Postgres names and email
+    also match approximately, best matches first.
+
+    :param q: The search query.
+    :type q: str
+    :param skip: The number of contacts to skip. Defaults to 0.
+    :type skip: int
+    :param limit: The maximum number of contacts to retrieve. Defaults to 100.
+    :type limit: int
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+
+    :return: The contacts matching the query.
+    :rtype: list[ResponseContact]
+
+    :raises HTTPException: If no contacts match the query.
+    """
+    contacts = await repo_contacts.search_contacts(
+        q, skip, limit, current_user, db
+    )
+    if not contacts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="There is no contacts",
+        )
+    return ORJSONResponse([dump_contact(contact) for contact in contacts])
+
+
 @router.get("/birthday", response_model=list[ResponseContact])
 async def get_birthday(
-    interval: int = 7,
-    db: Session = Depends(get_db),
+    interval: int = Query(default=7, ge=0, le=365),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
     Get a list of contacts with birthdays within the next `interval` days.
 
+    The list is precomputed daily and cached until a contact changes.
+
     :param interval: The number of days to consider for birthdays. Defaults to 7.
     :type interval: int
     :param db: The database session. Defaults to the result of `get_db` dependency.
-    :type db: Session
+    :type db: AsyncSession
     :param current_user: The current authenticated user. Defaults to the result of `auth_service.get_current_user` dependency.
     :type current_user: User
 
@@ -121,30 +328,107 @@ async def get_birthday(
 
     :raises HTTPException: If there are no contacts with birthdays within the next `interval` days.
     """
-    contacts = await repo_contacts.get_contacts_by_birthday(
-        interval, current_user, db
-    )
-    if not contacts:
+    data = await birthdays.get_birthday_digest(interval, current_user, db)
+    if data == b"[]":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"In the next {interval} days there are no birthdays.",
         )
-    return contacts
+    return Response(content=data, media_type="application/json")
+
+
+@router.patch(
+    "/batch",
+    response_model=list[ResponseContact],
+    dependencies=[RequestLimiter],
+)
+async def update_contacts(
+    body: ContactBatchUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Partially updates many contacts at once.
+
+    Each item names a contact id and only the fields to change. All items
+    are applied by a single UPDATE statement in one transaction.
+
+    :param body: The contact ids with their changed fields, at most 1000.
+    :type body: ContactBatchUpdate
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+
+    :return: The updated contacts, ids not found are left out.
+    :rtype: list[ResponseContact]
+
+    :raises HTTPException: If none of the contacts is found.
+    """
+    contacts = await repo_contacts.update_contacts(
+        body.items, current_user, db
+    )
+    if not contacts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Contacts not found"
+        )
+    return ORJSONResponse([dump_contact(contact) for contact in contacts])
+
+
+@router.delete(
+    "/batch",
+    response_model=list[ResponseContact],
+    dependencies=[RequestLimiter],
+)
+async def delete_contacts(
+    body: ContactBatchDelete,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Deletes many contacts at once with a single DELETE statement.
+
+    :param body: The ids of the contacts to delete, at most 1000.
+    :type body: ContactBatchDelete
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+
+    :return: The deleted contacts, ids not found are left out.
+    :rtype: list[ResponseContact]
+
+    :raises HTTPException: If none of the contacts is found.
+    """
+    contacts = await repo_contacts.delete_contacts(
+        body.ids, current_user, db
+    )
+    if not contacts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Contacts not found"
+        )
+    return ORJSONResponse([dump_contact(contact) for contact in contacts])
 
 
 @router.get("/{contact_id}", response_model=ResponseContact)
 async def get_contact(
     contact_id: int,
-    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
     Retrieves a contact from the database based on the provided contact ID.
 
+    With `If-None-Match` only the contact version is read first, an
+    unchanged contact is answered with 304 and no body.
+
     :param contact_id: The ID of the contact to retrieve.
     :type contact_id: int
+    :param if_none_match: ETag of the contact the client already holds.
+    :type if_none_match: str | None
     :param db: The database session to use for the query. Defaults to Depends(get_db).
-    :type db: Session, optional
+    :type db: AsyncSession, optional
     :param current_user: The current user making the request. Defaults to Depends(auth_service.get_current_user).
     :type current_user: User, optional
 
@@ -153,12 +437,30 @@ async def get_contact(
 
     :raises HTTPException: If the contact is not found.
     """
+    if if_none_match:
+        version = await repo_contacts.get_contact_version(
+            contact_id, current_user, db
+        )
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Contact not found",
+            )
+        tag = etag.contact_etag(version)
+        if etag.etag_matches(if_none_match, tag):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": tag},
+            )
     contact = await repo_contacts.get_contact(contact_id, current_user, db)
     if not contact:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
         )
-    return contact
+    return ORJSONResponse(
+        dump_contact(contact),
+        headers={"ETag": etag.contact_etag(contact.version)},
+    )
 
 
 @router.put(
@@ -169,7 +471,9 @@ async def get_contact(
 async def update_contact(
     body: ContactModel,
     contact_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -179,26 +483,74 @@ async def update_contact(
     :type body: ContactModel
     :param contact_id: The ID of the contact to update.
     :type contact_id: int
+    :param response: The response, gets the new ETag of the contact.
+    :type response: Response
+    :param if_match: Only update if the contact still has this ETag.
+    :type if_match: str | None
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :param current_user: The current authenticated user.
     :type current_user: User
 
     :return: The updated contact.
     :rtype: ResponseContact
 
-    :raises HTTPException: If the contact is not found.
+    :raises HTTPException: If the contact is not found or its ETag does not match `If-Match`.
     """
+    versions = if_match_versions(if_match)
     new_contact = await repo_contacts.update_contact(
-        body, contact_id, current_user, db
+        body, contact_id, current_user, db, versions=versions
     )
     if not new_contact:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found"
-        )
+        await raise_not_found(contact_id, versions, current_user, db)
+    response.headers["ETag"] = etag.contact_etag(new_contact.version)
     return new_contact
 
 
+@router.patch(
+    "/{contact_id}",
+    response_model=ResponseContact,
+    dependencies=[RequestLimiter],
+)
+async def patch_contact(
+    body: ContactPatch,
+    contact_id: int,
+    response: Response,
+    if_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Partially update a contact by its ID, only the given fields change.
+
+    :param body: The contact fields to change.
+    :type body: ContactPatch
+    :param contact_id: The ID of the contact to update.
+    :type contact_id: int
+    :param response: The response, gets the new ETag of the contact.
+    :type response: Response
+    :param if_match: Only update if the contact still has this ETag.
+    :type if_match: str | None
+    :param db: The database session.
+    :type db: AsyncSession
+    :param current_user: The current authenticated user.
+    :type current_user: User
+
+    :return: The updated contact.
+    :rtype: ResponseContact
+
+    :raises HTTPException: If the contact is not found or its ETag does not match `If-Match`.
+    """
+    versions = if_match_versions(if_match)
+    contact = await repo_contacts.update_contact(
+        body, contact_id, current_user, db, versions=versions
+    )
+    if not contact:
+        await raise_not_found(contact_id, versions, current_user, db)
+    response.headers["ETag"] = etag.contact_etag(contact.version)
+    return contact
+
+
 @router.delete(
     "/{contact_id}",
     response_model=ResponseContact,
@@ -206,7 +558,8 @@ async def update_contact(
 )
 async def delete_contact(
     contact_id: int,
-    db: Session = Depends(get_db),
+    if_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -214,13 +567,22 @@ async def delete_contact(
 
     :param contact_id: The ID of the contact to be deleted.
     :type contact_id: int
+    :param if_match: Only delete if the contact still has this ETag.
+    :type if_match: str | None
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :param current_user: The current user.
     :type current_user: User
 
     :return: The deleted contact.
     :rtype: Contact
+
+    :raises HTTPException: If the contact is not found or its ETag does not match `If-Match`.
     """
-    contact = await repo_contacts.delete_contact(contact_id, current_user, db)
+    versions = if_match_versions(if_match)
+    contact = await repo_contacts.delete_contact(
+        contact_id, current_user, db, versions=versions
+    )
+    if not contact:
+        await raise_not_found(contact_id, versions, current_user, db)
     return contact
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from src.conf.config import settings
+from src.services import metrics
+from src.services.auth import auth_service
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+async def metrics_enabled():
+    # pool and cache internals stay hidden unless explicitly exposed
+    if not settings.metrics_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Not Found"
+        )
+
+
+@router.get(
+    "/",
+    dependencies=[
+        Depends(metrics_enabled),
+        Depends(auth_service.get_current_user),
+    ],
+)
+async def read_metrics() -> dict:
+    """
+    Returns the metrics collected by the worker that served the request.
+
+    Only served with the `metrics_enabled` setting on, and to
+    authenticated users.
+
+    :return: Mapping of metric group name to its snapshot.
+    :rtype: dict
+
+    :raises HTTPException: If metrics are disabled or the user is not authenticated.
+    """
+    return metrics.collect()
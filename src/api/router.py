@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 from src.api.contacts import router as contacts_router
 from src.api.auth import router as auth_router
+from src.api.metrics import router as metrics_router
 
 router = APIRouter(prefix='/v1')
 
 router.include_router(contacts_router)
 router.include_router(auth_router)
+router.include_router(metrics_router)
@@ -1,7 +1,7 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import cloudinary
 import cloudinary.uploader
 
@@ -15,7 +15,7 @@ from src.schemas import UserDb
 router = APIRouter(prefix='/users', tags=["users"])
 
 current_user = Annotated[User, Depends(auth_service.get_current_user)]
-connect_db = Annotated[Session, Depends(get_db)]
+connect_db = Annotated[AsyncSession, Depends(get_db)]
 
 
 @router.get("/me", response_model=UserDb)
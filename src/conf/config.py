@@ -4,16 +4,43 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    metrics_enabled: bool = False
     secret_key: str
     algorithm: str
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 32
     mail_username: str
     mail_password: str
     mail_from: str
     mail_port: int
     mail_server: str
     mail_from_name: str
+    email_batch_size: int = 50
+    email_smtp_pool_size: int = 2
+    email_max_attempts: int = 5
+    email_retry_backoff: float = 2.0
+    email_templates_reload: bool = False
+    email_request_dedup_ttl: int = 300
+    signup_idempotency_ttl: int = 86400
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    user_cache_maxsize: int = 1024
+    user_cache_local_ttl: int = 60
+    user_cache_negative_ttl: int = 30
+    token_cache_maxsize: int = 4096
+    stateless_access_tokens: bool = False
+    birthday_digest_intervals: list[int] = [7]
+    birthday_digest_schedule: bool = False
+    contacts_import_chunk_size: int = 1000
+    contact_cache_enabled: bool = True
+    contact_cache_ttl: int = 300
+    contact_cache_redis_host: str | None = None
+    contact_cache_redis_port: int = 6379
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
@@ -1,16 +1,121 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from src.conf.config import settings
+from src.services import metrics
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def get_async_url(url: str) -> URL:
+    """Swaps the sync DBAPI driver of ``url`` for its asyncio counterpart.
+
+    Alembic keeps using the sync url from settings, the application talks
+    to the database through asyncpg (Postgres) or aiosqlite (SQLite).
+
+    :param url: Database url from settings.
+    :type url: str
+    :return: Url with an async driver.
+    :rtype: URL
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url
+
+
+class PoolStats:
+    def __init__(self):
+        self.wait_time = metrics.Histogram()
+        self.timeouts = 0
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool recording how long checkouts wait for a connection."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.wait_time.observe(time.perf_counter() - start)
+
+
+def get_engine_options(url: URL) -> dict:
+    """Builds pool options for the engine from settings.
+
+    SQLite files are served by aiosqlite through a NullPool, which does not
+    accept sizing options, so only pre-ping and recycle apply there.
+
+    :param url: Async database url.
+    :type url: URL
+    :return: Keyword arguments for ``create_async_engine``.
+    :rtype: dict
+    """
+    options = {
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+    return options
+
+
+ASYNC_SQLALCHEMY_DATABASE_URL = get_async_url(SQLALCHEMY_DATABASE_URL)
+engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    **get_engine_options(ASYNC_SQLALCHEMY_DATABASE_URL),
+)
+SessionLocal = async_sessionmaker(
+    engine, autoflush=False, expire_on_commit=False
+)
+
+
+def get_pool_stats() -> dict:
+    """Reports the state of this worker's connection pool.
+
+    :return: Pool size, checked out and overflow connections, checkout
+        timeouts and a histogram of checkout wait time in seconds.
+    :rtype: dict
+    """
+    pool = engine.pool
+    stats = {"status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=settings.db_max_overflow,
+        )
+    stats.update(
+        timeouts=pool_stats.timeouts,
+        wait_time=pool_stats.wait_time.snapshot(),
+    )
+    return stats
+
+
+metrics.register("db_pool", get_pool_stats)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,7 +1,43 @@
 from datetime import date, datetime
 
-from sqlalchemy import ForeignKey, String, func
+from sqlalchemy import (
+    Computed,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    column,
+    func,
+    literal_column,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class month_day(FunctionElement):
+    """``MMDD`` of a date as an integer, e.g. 229 for February 29.
+
+    Unlike the day of the year it does not shift in leap years, so ranges
+    of upcoming birthdays compare the same way every year.
+    """
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(month_day, "sqlite")
+def _sqlite_month_day(element, compiler, **kw):
+    date_ = compiler.process(element.clauses, **kw)
+    return f"CAST(strftime('%m%d', {date_}) AS INTEGER)"
+
+
+@compiles(month_day)
+def _month_day(element, compiler, **kw):
+    date_ = compiler.process(element.clauses, **kw)
+    return (
+        f"CAST(EXTRACT(MONTH FROM {date_}) * 100"
+        f" + EXTRACT(DAY FROM {date_}) AS INTEGER)"
+    )
 
 
 class Base(DeclarativeBase):
@@ -22,17 +58,75 @@ class User(Base):
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
     refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
     confirmed: Mapped[bool] = mapped_column(default=False)
+    # bumped to revoke all stateless access tokens of the user
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")
 
 
 class Contact(Base):
     __tablename__ = "contacts"  # noqa
+    __table_args__ = (
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        Index("ix_contacts_user_id_birthday_md", "user_id", "birthday_md"),
+        Index(
+            "ix_contacts_user_id_last_name_first_name",
+            "user_id",
+            "last_name",
+            "first_name",
+        ),
+    )
+    # fetch birthday_md with RETURNING instead of a lazy load after flush
+    __mapper_args__ = {"eager_defaults": True}
     id: Mapped[int] = mapped_column(primary_key=True)
     first_name: Mapped[str] = mapped_column(String(100), nullable=False)
     last_name: Mapped[str] = mapped_column(String(100), nullable=False)
     email: Mapped[str] = mapped_column(String(70), nullable=True, default=None)
     phone: Mapped[str] = mapped_column(String(20), nullable=True, default=None)
     birthday: Mapped[date] = mapped_column(nullable=True, default=None)
+    birthday_md: Mapped[int] = mapped_column(
+        Computed(month_day(column("birthday")), persisted=True), nullable=True
+    )
     user_id: Mapped[int] = mapped_column(
         "user_id", ForeignKey("users.id", ondelete="CASCADE"), default=None
     )
+    # bumped by every update, the contact's ETag
+    version: Mapped[int] = mapped_column(default=1, server_default="1")
     user = relationship("User", backref="contacts")
+
+
+def phone_digits(phone):
+    """SQL expression stripping the ``tel:`` prefix and dashes that
+    PhoneNumber adds to stored phone numbers.
+
+    The constants are inlined rather than bound, so queries render the
+    exact expression of ``ix_contacts_phone_digits_trgm`` and still match
+    it under the generic plans of prepared statements.
+    """
+    empty = literal_column("''")
+    return func.replace(
+        func.replace(phone, literal_column("'tel:'"), empty),
+        literal_column("'-'"),
+        empty,
+    )
+
+
+# Case-insensitive email lookups, see contacts_query
+Index(
+    "ix_contacts_user_id_lower_email",
+    Contact.user_id,
+    func.lower(Contact.email),
+)
+
+# Trigram indexes behind contact search, Postgres only (needs pg_trgm)
+for column in (Contact.first_name, Contact.last_name, Contact.email):
+    Index(
+        f"ix_contacts_{column.key}_trgm",
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column.key: "gin_trgm_ops"},
+    ).ddl_if(dialect="postgresql")
+Index(
+    "ix_contacts_phone_digits_trgm",
+    phone_digits(Contact.phone).label("phone_digits"),
+    postgresql_using="gin",
+    postgresql_ops={"phone_digits": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
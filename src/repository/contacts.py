@@ -1,116 +1,492 @@
-from datetime import datetime, timedelta
+import base64
+import re
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Sequence
 
-from sqlalchemy import and_, select
-from sqlalchemy.orm import Session
+import orjson
+from sqlalchemy import (
+    Row,
+    Select,
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Contact, User
-from src.schemas.contacts import ContactModel, ResponseContact
+from src.database.models import Contact, User, phone_digits
+from src.schemas.contacts import (
+    ContactBatchPatch,
+    ContactModel,
+    ContactPatch,
+    ResponseContact,
+)
+from src.services.cache import birthday_cache, contact_cache
+
+
+SORT_COLUMNS = {
+    "id": Contact.id,
+    "first_name": Contact.first_name,
+    "last_name": Contact.last_name,
+}
+
+
+def contacts_query(
+    user: User,
+    first_name: str | None = None,
+    last_name: str | None = None,
+    email: str | None = None,
+    sort_by: str = "id",
+) -> Select:
+    """Builds the statement selecting the contacts of ``user``.
+
+    Every given filter must match. Rows are ordered by ``sort_by`` with the
+    id as tie-breaker, a total order that keyset pagination relies on.
+
+    :param sort_by: One of :data:`SORT_COLUMNS`.
+    :type sort_by: str
+    :return: Statement to be paginated by the caller.
+    :rtype: Select
+    """
+    conditions = [Contact.user_id == user.id]
+    if first_name:
+        conditions.append(Contact.first_name == first_name.title())
+    if last_name:
+        conditions.append(Contact.last_name == last_name.title())
+    if email:
+        conditions.append(func.lower(Contact.email) == email.lower())
+    return (
+        select(Contact)
+        .filter(and_(*conditions))
+        .order_by(SORT_COLUMNS[sort_by], Contact.id)
+    )
 
 
 async def get_contacts(
-    skip: int, limit: int, user: User, db: Session
+    skip: int,
+    limit: int,
+    user: User,
+    db: AsyncSession,
+    first_name: str | None = None,
+    last_name: str | None = None,
+    email: str | None = None,
+    sort_by: str = "id",
 ) -> list[ResponseContact] | None:
     statement = (
-        select(Contact)
-        .filter(Contact.user_id == user.id)
+        contacts_query(user, first_name, last_name, email, sort_by)
         .offset(skip)
         .limit(limit)
     )
-    return db.execute(statement).scalars().fetchall() or None
+    result = await db.execute(statement)
+    return result.scalars().fetchall() or None
 
 
-async def get_contact_by_first_name(
-    first_name: str, user: User, db: Session
-) -> ResponseContact | None:
-    statement = select(Contact).filter(
-        and_(
-            Contact.first_name == first_name.title(),
-            Contact.user_id == user.id,
-        )
-    )
-    return db.execute(statement).scalar_one_or_none()
+def encode_cursor(contact: Contact, sort_by: str = "id") -> str:
+    payload = {"sort": sort_by, "key": [getattr(contact, sort_by), contact.id]}
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).decode()
 
 
-async def get_contact_by_last_name(
-    last_name: str, user: User, db: Session
-) -> ResponseContact | None:
-    statement = select(Contact).filter(
-        and_(
-            Contact.last_name == last_name.title(), Contact.user_id == user.id
+def decode_cursor(cursor: str, sort_by: str = "id") -> tuple[int | str, int]:
+    """Returns the sort key of the last contact of the previous page.
+
+    :raises ValueError: If the cursor was not made by :func:`encode_cursor`
+        for the same ``sort_by``.
+    """
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor))
+        sort, (value, last_id) = payload["sort"], payload["key"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    value_type = int if sort_by == "id" else str
+    if (
+        sort != sort_by
+        or not isinstance(value, value_type)
+        or not isinstance(last_id, int)
+    ):
+        raise ValueError("Invalid cursor")
+    return value, last_id
+
+
+async def get_contacts_page(
+    cursor: str | None,
+    limit: int,
+    user: User,
+    db: AsyncSession,
+    first_name: str | None = None,
+    last_name: str | None = None,
+    email: str | None = None,
+    sort_by: str = "id",
+) -> tuple[list[ResponseContact], str | None]:
+    """Keyset pagination over ``(sort_by, id)`` within the user's contacts.
+
+    Seeks past the last contact of the previous page instead of skipping
+    rows, so every page costs the same. One extra row is fetched to tell
+    whether a next page exists.
+
+    :return: The contacts of the page and the cursor of the next page, None
+        on the last page.
+    :raises ValueError: If the cursor is invalid.
+    """
+    statement = contacts_query(user, first_name, last_name, email, sort_by)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_by)
+        if sort_by == "id":
+            statement = statement.filter(Contact.id > last_id)
+        else:
+            statement = statement.filter(
+                tuple_(SORT_COLUMNS[sort_by], Contact.id)
+                > tuple_(value, last_id)
+            )
+    statement = statement.limit(limit + 1)
+    contacts = (await db.execute(statement)).scalars().fetchall()
+    if len(contacts) > limit:
+        return contacts[:limit], encode_cursor(contacts[limit - 1], sort_by)
+    return contacts, None
+
+
+async def search_contacts(
+    q: str, skip: int, limit: int, user: User, db: AsyncSession
+) -> list[ResponseContact] | None:
+    """Case-insensitive prefix search over names, email and phone.
+
+    On Postgres names and email also match fuzzily through pg_trgm
+    similarity, most similar first; both kinds of match are served by the
+    trigram GIN indexes. Phone numbers match on any run of digits.
+    """
+    q = q.strip()
+    conditions = [
+        Contact.first_name.istartswith(q, autoescape=True),
+        Contact.last_name.istartswith(q, autoescape=True),
+        Contact.email.istartswith(q, autoescape=True),
+    ]
+    digits = re.sub(r"[\s()+-]", "", q)
+    if digits.isdigit():
+        conditions.append(
+            phone_digits(Contact.phone).contains(digits, autoescape=True)
         )
+    if db.bind.dialect.name == "postgresql":
+        fuzzy_columns = (Contact.first_name, Contact.last_name, Contact.email)
+        conditions.extend(column.op("%")(q) for column in fuzzy_columns)
+        similarity = func.greatest(
+            *(func.similarity(column, q) for column in fuzzy_columns)
+        )
+        order_by = (similarity.desc(), Contact.id)
+    else:
+        order_by = (Contact.last_name, Contact.first_name, Contact.id)
+    statement = (
+        select(Contact)
+        .filter(and_(Contact.user_id == user.id, or_(*conditions)))
+        .order_by(*order_by)
+        .offset(skip)
+        .limit(limit)
     )
-    return db.execute(statement).scalar_one_or_none()
+    result = await db.execute(statement)
+    return result.scalars().fetchall() or None
 
 
-async def get_contact_by_email(
-    email: str, user: User, db: Session
-) -> ResponseContact | None:
-    statement = select(Contact).filter(
-        and_(Contact.email == email.lower(), Contact.user_id == user.id)
-    )
-    return db.execute(statement).scalar_one_or_none()
+def to_month_day(day: date) -> int:
+    return day.month * 100 + day.day
 
 
 async def get_contacts_by_birthday(
-    interval: int, user: User, db: Session
+    interval: int, user: User, db: AsyncSession
 ) -> list[ResponseContact] | None:
-    start_date = datetime.now().date() - timedelta(days=interval)
-    statement = select(Contact).filter(Contact.user_id == user.id)
-    contacts = db.execute(statement).scalars()
-    result = []
-    for contact in contacts:
-        if start_date <= contact.birthday.replace(year=start_date.year):
-            result.append(contact)
-    return result or None
+    """Contacts whose birthday falls within today and the next ``interval``
+    days, soonest first.
+
+    Compares the indexed ``birthday_md`` column, so this is a range scan on
+    ``(user_id, birthday_md)``. A range crossing New Year is split in two,
+    February 29 birthdays fall between February 28 and March 1.
+    """
+    today = datetime.now().date()
+    start = to_month_day(today)
+    end = to_month_day(today + timedelta(days=interval))
+    if interval >= 365:
+        in_range = Contact.birthday_md.is_not(None)
+    elif start <= end:
+        in_range = Contact.birthday_md.between(start, end)
+    else:
+        in_range = or_(
+            Contact.birthday_md >= start, Contact.birthday_md <= end
+        )
+    statement = (
+        select(Contact)
+        .filter(and_(Contact.user_id == user.id, in_range))
+        .order_by(
+            case((Contact.birthday_md >= start, 0), else_=1),
+            Contact.birthday_md,
+            Contact.id,
+        )
+    )
+    result = await db.execute(statement)
+    return result.scalars().fetchall() or None
 
 
 async def create_contact(
-    body: ContactModel, user: User, db: Session
+    body: ContactModel, user: User, db: AsyncSession
 ) -> ResponseContact:
     contact = Contact(**body.model_dump(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await db.refresh(contact)
+    await birthday_cache.invalidate(user.id)
+    # ids can be reused after a delete on SQLite
+    await contact_cache.invalidate(user.id, contact.id)
     return contact
 
 
+EXPORT_COLUMNS = (
+    Contact.id,
+    Contact.first_name,
+    Contact.last_name,
+    Contact.phone,
+    Contact.email,
+    Contact.birthday,
+)
+
+
+async def stream_contacts(
+    user: User, db: AsyncSession, chunk_size: int = 500
+) -> AsyncIterator[Sequence[Row]]:
+    """Streams all contacts of a user in id order over a server-side
+    cursor.
+
+    Rows are plain column tuples rather than ORM objects, so nothing
+    accumulates in the session identity map while exporting.
+
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param chunk_size: Rows fetched from the cursor at a time.
+    :type chunk_size: int
+    :return: Lists of up to ``chunk_size`` rows.
+    :rtype: AsyncIterator[Sequence[Row]]
+    """
+    statement = (
+        select(*EXPORT_COLUMNS)
+        .filter(Contact.user_id == user.id)
+        .order_by(Contact.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    result = await db.stream(statement)
+    async for partition in result.partitions():
+        yield partition
+
+
+async def create_contacts(
+    bodies: list[ContactModel], user: User, db: AsyncSession
+) -> int:
+    """Inserts contacts with a single multi-row INSERT and commits.
+
+    :param bodies: The contacts to create.
+    :type bodies: list[ContactModel]
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of contacts created.
+    :rtype: int
+    """
+    result = await db.execute(
+        insert(Contact).returning(Contact.id),
+        [{**body.model_dump(), "user_id": user.id} for body in bodies],
+    )
+    contact_ids = result.scalars().all()
+    await db.commit()
+    await birthday_cache.invalidate(user.id)
+    await contact_cache.invalidate(user.id, *contact_ids)
+    return len(contact_ids)
+
+
 async def get_contact(
-    contact_id: int, user: User, db: Session
+    contact_id: int, user: User, db: AsyncSession
 ) -> ResponseContact | None:
+    """Returns a contact of the user, read through the contact cache.
+
+    :param contact_id: The id of the contact.
+    :type contact_id: int
+    :param user: The owner of the contact.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The contact, a detached instance on a cache hit, or None if
+        not found.
+    :rtype: ResponseContact | None
+    """
+    contact = await contact_cache.get(user.id, contact_id)
+    if contact is not None:
+        return contact
+    # read before the row, so a write committing in between voids the fill
+    generation = await contact_cache.generation(user.id)
     statement = select(Contact).filter(
         and_(Contact.id == contact_id, Contact.user_id == user.id)
     )
-    return db.execute(statement).scalar_one_or_none()
+    result = await db.execute(statement)
+    contact = result.scalar_one_or_none()
+    if contact is not None:
+        await contact_cache.set(contact, generation)
+    return contact
+
+
+async def get_contact_version(
+    contact_id: int, user: User, db: AsyncSession
+) -> int | None:
+    contact = await contact_cache.get(user.id, contact_id)
+    if contact is not None:
+        return contact.version
+    statement = select(Contact.version).filter(
+        and_(Contact.id == contact_id, Contact.user_id == user.id)
+    )
+    return (await db.execute(statement)).scalar_one_or_none()
 
 
 async def update_contact(
-    body: ContactModel, contact_id: int, user: User, db: Session
+    body: ContactModel | ContactPatch,
+    contact_id: int,
+    user: User,
+    db: AsyncSession,
+    versions: list[int] | None = None,
 ) -> ResponseContact | None:
-    statement = select(Contact).filter(
-        and_(Contact.id == contact_id, Contact.user_id == user.id)
+    """Updates a contact with a single UPDATE ... RETURNING statement.
+
+    A :class:`ContactModel` replaces all fields, a :class:`ContactPatch`
+    only writes the fields it sets. Every update bumps the version.
+
+    :param body: The new contact data.
+    :type body: ContactModel | ContactPatch
+    :param contact_id: The id of the contact to update.
+    :type contact_id: int
+    :param user: The owner of the contact.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param versions: Only update if the contact has one of these versions.
+    :type versions: list[int] | None
+    :return: The updated contact, or None if not found or on a version
+        mismatch.
+    :rtype: ResponseContact | None
+    """
+    values = body.model_dump(exclude_unset=isinstance(body, ContactPatch))
+    conditions = [Contact.id == contact_id, Contact.user_id == user.id]
+    if versions is not None:
+        conditions.append(Contact.version.in_(versions))
+    if not values:
+        statement = select(Contact).where(*conditions)
+        return (await db.scalars(statement)).one_or_none()
+    statement = (
+        update(Contact)
+        .where(*conditions)
+        .values(values)
+        .values(version=Contact.version + 1)
+        .returning(Contact)
     )
-    contact = db.execute(statement).scalar_one_or_none()
-    if not contact:
-        return None
-    contact.first_name = body.first_name
-    contact.last_name = body.last_name
-    contact.phone = body.phone
-    contact.email = body.email
-    contact.birthday = body.birthday
-    db.commit()
-    db.refresh(contact)
+    contact = (await db.scalars(statement)).one_or_none()
+    await db.commit()
+    if contact:
+        await birthday_cache.invalidate(user.id)
+        await contact_cache.invalidate(user.id, contact_id)
     return contact
 
 
 async def delete_contact(
-    contact_id: int, user: User, db: Session
+    contact_id: int,
+    user: User,
+    db: AsyncSession,
+    versions: list[int] | None = None,
 ) -> ResponseContact | None:
-    statement = select(Contact).filter(
-        and_(Contact.id == contact_id, Contact.user_id == user.id)
-    )
-    contact = db.execute(statement).scalar_one_or_none()
-    if not contact:
-        return None
-    db.delete(contact)
-    db.commit()
+    conditions = [Contact.id == contact_id, Contact.user_id == user.id]
+    if versions is not None:
+        conditions.append(Contact.version.in_(versions))
+    statement = delete(Contact).where(*conditions).returning(Contact)
+    contact = (await db.scalars(statement)).one_or_none()
+    await db.commit()
+    if contact:
+        await birthday_cache.invalidate(user.id)
+        await contact_cache.invalidate(user.id, contact_id)
     return contact
+
+
+async def update_contacts(
+    patches: list[ContactBatchPatch], user: User, db: AsyncSession
+) -> list[Contact]:
+    """Applies partial updates to many contacts in one UPDATE statement.
+
+    Every column set by some patch gets a ``CASE id WHEN ...`` expression
+    that keeps the current value for the contacts not changing it. Ids of
+    other users or unknown ids are ignored.
+
+    :param patches: Contact ids with the fields to change.
+    :type patches: list[ContactBatchPatch]
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The updated contacts.
+    :rtype: list[Contact]
+    """
+    changes: dict[str, dict[int, object]] = {}
+    for patch in patches:
+        for field, value in patch.model_dump(
+            exclude_unset=True, exclude={"id"}
+        ).items():
+            changes.setdefault(field, {})[patch.id] = value
+    ids = [patch.id for patch in patches]
+    if not changes:
+        statement = select(Contact)
+    else:
+        statement = (
+            update(Contact)
+            .values({
+                field: case(
+                    values, value=Contact.id, else_=getattr(Contact, field)
+                )
+                for field, values in changes.items()
+            })
+            .values(version=Contact.version + 1)
+            .returning(Contact)
+        )
+    statement = statement.where(
+        Contact.id.in_(ids), Contact.user_id == user.id
+    )
+    contacts = (await db.scalars(statement)).all()
+    await db.commit()
+    if changes:
+        await birthday_cache.invalidate(user.id)
+        await contact_cache.invalidate(
+            user.id, *(contact.id for contact in contacts)
+        )
+    return sorted(contacts, key=lambda contact: contact.id)
+
+
+async def delete_contacts(
+    ids: list[int], user: User, db: AsyncSession
+) -> list[Contact]:
+    """Deletes many contacts in one DELETE statement.
+
+    :param ids: The ids of the contacts to delete.
+    :type ids: list[int]
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The deleted contacts, unknown ids are ignored.
+    :rtype: list[Contact]
+    """
+    statement = (
+        delete(Contact)
+        .where(Contact.id.in_(ids), Contact.user_id == user.id)
+        .returning(Contact)
+    )
+    contacts = (await db.scalars(statement)).all()
+    await db.commit()
+    await birthday_cache.invalidate(user.id)
+    await contact_cache.invalidate(
+        user.id, *(contact.id for contact in contacts)
+    )
+    return sorted(contacts, key=lambda contact: contact.id)
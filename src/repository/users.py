@@ -1,17 +1,19 @@
 from libgravatar import Gravatar
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
-from src.schemas.users import UserModel
+from src.schemas.users import Principal, UserModel
+from src.services.cache import token_revocations, user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     statement = select(User).filter(User.email == email)
-    return db.execute(statement).scalar_one_or_none()
+    result = await db.execute(statement)
+    return result.scalar_one_or_none()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     avatar = None
     try:
         g = Gravatar(body.email)
@@ -20,24 +22,72 @@ async def create_user(body: UserModel, db: Session) -> User:
         print(e)
     new_user = User(**body.model_dump(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    await user_cache.invalidate(new_user.email)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
-    user.refresh_token = token
-    db.commit()
+async def update_token(
+    user: User, token: str | None, db: AsyncSession
+) -> None:
+    statement = (
+        update(User).where(User.id == user.id).values(refresh_token=token)
+    )
+    await db.execute(statement)
+    await db.commit()
+    await user_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+async def confirmed_email(email: str, db: AsyncSession) -> None:
+    statement = update(User).where(User.email == email).values(confirmed=True)
+    await db.execute(statement)
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_avatar(email: str, src_url: str, db: Session) -> User:
-    user = await get_user_by_email(email, db)
-    user.avatar = src_url
-    db.commit()
+async def update_avatar(
+    email: str, src_url: str, db: AsyncSession
+) -> User | None:
+    statement = (
+        update(User)
+        .where(User.email == email)
+        .values(avatar=src_url)
+        .returning(User)
+    )
+    user = (await db.scalars(statement)).one_or_none()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
+
+
+async def get_token_version(user_id: int, db: AsyncSession) -> int | None:
+    statement = select(User.token_version).filter(User.id == user_id)
+    result = await db.execute(statement)
+    return result.scalar_one_or_none()
+
+
+async def revoke_tokens(user: User | Principal, db: AsyncSession) -> int:
+    """Signs the user out everywhere.
+
+    Drops the refresh token and bumps the token version, which refuses
+    every stateless access token issued before.
+
+    :param user: The user, an ORM row or a principal.
+    :type user: User | Principal
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The new token version.
+    :rtype: int
+    """
+    statement = (
+        update(User)
+        .where(User.id == user.id)
+        .values(refresh_token=None, token_version=User.token_version + 1)
+        .returning(User.token_version)
+    )
+    version = (await db.execute(statement)).scalar_one()
+    await db.commit()
+    await user_cache.invalidate(user.email)
+    await token_revocations.revoke(user.id, version)
+    return version
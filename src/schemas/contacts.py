@@ -1,6 +1,6 @@
 from datetime import date
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from pydantic_extra_types.phone_numbers import PhoneNumber
 
 """
@@ -23,9 +23,66 @@ class ContactModel(BaseModel):
     birthday: Optional[date] = None
 
 
+class ContactPatch(BaseModel):
+    """Partial contact update, only the fields that are set change.
+
+    Required fields may be left out but not set to null.
+    """
+
+    first_name: str = None
+    last_name: str = None
+    phone: PhoneNumber = None
+    email: Optional[EmailStr] = None
+    birthday: Optional[date] = None
+
+
+class ContactBatchPatch(ContactPatch):
+    id: int
+
+
+class ContactBatchUpdate(BaseModel):
+    items: list[ContactBatchPatch] = Field(min_length=1, max_length=1000)
+
+
+class ContactBatchDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+
 class ResponseContact(ContactModel):
     id: int
 
     class Config:
         from_attributes: bool = True
 
+
+RESPONSE_FIELDS = tuple(ResponseContact.model_fields)
+
+
+def dump_contact(contact) -> dict:
+    """Builds the :class:`ResponseContact` payload of a stored contact.
+
+    Fast path for read routes returning many contacts: stored values went
+    through :class:`ContactModel` validation when they were written, so
+    they are copied as is instead of being validated again.
+
+    :param contact: ORM contact or row with the response fields.
+    :return: Payload for an orjson response.
+    :rtype: dict
+    """
+    return {field: getattr(contact, field) for field in RESPONSE_FIELDS}
+
+
+class ContactPage(BaseModel):
+    items: list[ResponseContact]
+    next_cursor: Optional[str] = None
+
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: list[dict]
+
+
+class ImportReport(BaseModel):
+    created: int
+    failed: int
+    errors: list[ImportRowError]
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import datetime
 
 from pydantic import BaseModel, Field, EmailStr
@@ -33,3 +34,23 @@ class TokenModel(BaseModel):
 
 class RequestEmail(BaseModel):
     email: EmailStr
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """Authenticated user as seen by the routes.
+
+    Cached instead of the ORM row, so it carries neither the password hash
+    nor the refresh token. Principals of stateless access tokens are built
+    from the token claims and have no avatar.
+    """
+    id: int
+    email: str
+    username: str
+    confirmed: bool
+    avatar: str | None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(user.id, user.email, user.username, user.confirmed,
+                   user.avatar)
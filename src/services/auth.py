@@ -1,4 +1,3 @@
-import pickle
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -6,26 +5,41 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from redis import Redis
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import settings
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.schemas.users import Principal
+from src.services.cache import token_cache, token_revocations, user_cache
+from src.services.hashing import hashing_pool
 
 
 class Auth:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
+    STATELESS = settings.stateless_access_tokens
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        return await hashing_pool.run(
+            self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password: str):
+        return await hashing_pool.run(self.pwd_context.hash, password)
+
+    def principal_claims(self, user) -> dict:
+        """Claims letting :meth:`get_current_user` build the principal from
+        the access token alone, empty unless stateless tokens are on."""
+        if not self.STATELESS:
+            return {}
+        return {
+            "uid": user.id,
+            "name": user.username,
+            "confirmed": user.confirmed,
+            "tv": user.token_version,
+        }
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict,
@@ -60,10 +74,29 @@ class Auth:
             to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
+    def decode_token(self, token: str) -> dict:
+        """Verifies a JWT and returns its claims.
+
+        Verified claims are cached until the token expires, so a client
+        sending the same token again skips the signature check.
+
+        :param token: Encoded JWT.
+        :type token: str
+        :return: The token claims.
+        :rtype: dict
+        :raises JWTError: If the token is invalid or expired.
+        """
+        key = token_cache.key(token)
+        payload = token_cache.get(key)
+        if payload is None:
+            payload = jwt.decode(
+                token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            token_cache.set(key, payload)
+        return payload
+
     async def decode_refresh_token(self, refresh_token: str):
         try:
-            payload = jwt.decode(
-                refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(refresh_token)
             if payload['scope'] == 'refresh_token':
                 email = payload['sub']
                 return email
@@ -75,7 +108,7 @@ class Auth:
                                 detail='Could not validate credentials')
 
     async def get_current_user(self, token: str = Depends(oauth2_scheme),
-                               db: Session = Depends(get_db)):
+                               db: AsyncSession = Depends(get_db)):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -84,8 +117,7 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY,
-                                 algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -94,16 +126,28 @@ class Auth:
                 raise credentials_exception
         except JWTError:
             raise credentials_exception
-        user = self.r.get(f'email:{email}')
-        if user is None:
-            user = await repository_users.get_user_by_email(email, db)
-            self.r.set(f'email:{email}', pickle.dumps(user))
-            self.r.expire(f'email:{email}', 60 * 15)
-            if user is None:
+
+        if self.STATELESS and "uid" in payload:
+            # no storage I/O, only the in-process revocation set
+            if token_revocations.is_revoked(payload["uid"], payload["tv"]):
                 raise credentials_exception
-        else:
-            user = pickle.loads(user)
-        return user
+            if not token_revocations.synced:
+                # revocations may have been missed, the database decides
+                version = await repository_users.get_token_version(
+                    payload["uid"], db)
+                if version is None or payload["tv"] < version:
+                    raise credentials_exception
+            return Principal(payload["uid"], email, payload["name"],
+                             payload["confirmed"], None)
+
+        async def load_principal():
+            user = await repository_users.get_user_by_email(email, db)
+            return None if user is None else Principal.from_user(user)
+
+        principal = await user_cache.get_or_load(email, load_principal)
+        if principal is None:
+            raise credentials_exception
+        return principal
 
     def create_email_token(self, data: dict):
         to_encode = data.copy()
@@ -115,8 +159,7 @@ class Auth:
 
     async def get_email_from_token(self, token: str):
         try:
-            payload = jwt.decode(token, self.SECRET_KEY,
-                                 algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             email = payload["sub"]
             return email
         except JWTError as e:
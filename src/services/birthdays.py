@@ -0,0 +1,133 @@
+"""Daily precomputation of upcoming-birthday lists.
+
+Run once a day, e.g. from cron shortly after midnight::
+
+    python -m src.services.birthdays
+
+or set ``BIRTHDAY_DIGEST_SCHEDULE=true`` to let the API workers run it on
+their own; a Redis lock makes sure only one worker does per day.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+
+import orjson
+import redis.asyncio as redis
+from sqlalchemy import distinct, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.database.models import Contact, User
+from src.repository import contacts as repo_contacts
+from src.schemas.contacts import dump_contact
+from src.services.cache import birthday_cache
+
+logger = logging.getLogger(__name__)
+
+# seconds before a failed run is retried, doubled up to an hour
+RETRY_BACKOFF = 60
+# a worker dying mid-run holds the day's lock no longer than this
+LOCK_TTL = 60 * 60
+
+
+def dumps_contacts(contacts: list[Contact] | None) -> bytes:
+    return orjson.dumps([dump_contact(contact) for contact in contacts or ()])
+
+
+async def get_birthday_digest(
+    interval: int, user: User, db: AsyncSession
+) -> bytes:
+    """Returns today's upcoming-birthday list of ``user`` as a JSON body.
+
+    Served from the digest cache, computed and cached on a miss.
+
+    :param interval: The number of days to consider for birthdays.
+    :type interval: int
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: JSON array of contacts, empty if there are no birthdays.
+    :rtype: bytes
+    """
+    today = date.today()
+    data = await birthday_cache.get(user.id, interval, today)
+    if data is None:
+        generation = await birthday_cache.generation(user.id)
+        contacts = await repo_contacts.get_contacts_by_birthday(
+            interval, user, db
+        )
+        data = dumps_contacts(contacts)
+        await birthday_cache.set(user.id, interval, today, data, generation)
+    return data
+
+
+async def precompute_birthday_digests(db: AsyncSession) -> int:
+    """Caches today's lists for every user with contacts.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of users processed.
+    :rtype: int
+    """
+    today = date.today()
+    user_ids = (await db.scalars(select(distinct(Contact.user_id)))).all()
+    for user_id in user_ids:
+        for interval in settings.birthday_digest_intervals:
+            generation = await birthday_cache.generation(user_id)
+            contacts = await repo_contacts.get_contacts_by_birthday(
+                interval, User(id=user_id), db
+            )
+            await birthday_cache.set(
+                user_id, interval, today, dumps_contacts(contacts), generation
+            )
+    return len(user_ids)
+
+
+async def run_daily() -> None:
+    """Precomputes the digests now and after every midnight.
+
+    Meant to run as a task in each API worker, the first worker to take
+    the day's Redis lock does the work. A failed run releases the lock
+    and is retried with exponential backoff, by whichever worker takes
+    the lock next.
+    """
+    backoff = RETRY_BACKOFF
+    while True:
+        lock = f"birthdays:job:{date.today().isoformat()}"
+        try:
+            if await birthday_cache.r.set(lock, 1, nx=True, ex=LOCK_TTL):
+                try:
+                    async with SessionLocal() as db:
+                        await precompute_birthday_digests(db)
+                except Exception:
+                    await birthday_cache.r.delete(lock)
+                    raise
+                await birthday_cache.r.expire(lock, 60 * 60 * 24)
+        except Exception:
+            logger.exception(
+                "Birthday digest precompute failed, retrying in %s s", backoff
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60 * 60)
+            continue
+        backoff = RETRY_BACKOFF
+        tomorrow = datetime.combine(date.today() + timedelta(days=1), time())
+        await asyncio.sleep((tomorrow - datetime.now()).total_seconds())
+
+
+async def main() -> None:
+    birthday_cache.r = redis.Redis(
+        host=settings.redis_host, port=settings.redis_port, db=0
+    )
+    try:
+        async with SessionLocal() as db:
+            count = await precompute_birthday_digests(db)
+        print(f"Birthday digests precomputed for {count} users")
+    finally:
+        await birthday_cache.r.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
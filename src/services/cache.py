@@ -0,0 +1,631 @@
+import asyncio
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Hashable
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError, WatchError
+
+from src.conf.config import settings
+from src.database.models import Contact
+from src.schemas.users import Principal
+from src.services import metrics
+
+# Bump when the Principal fields change, old entries then simply expire
+PRINCIPAL_VERSION = 1
+# Same for the contact fields cached by ContactCache
+CONTACT_VERSION = 1
+
+# Returned by UserCache.get on a miss; None is a cached unknown user
+MISS = object()
+# Returned by Idempotency.run while the first request of a key still runs
+PENDING = object()
+
+
+class LRUCache:
+    """Size bounded in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(
+        self, key: Hashable, value: Any, ttl: float | None = None
+    ) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+def dumps_principal(principal: Principal | None) -> bytes:
+    """Serializes a principal as a positional JSON array.
+
+    :param principal: Principal to serialize, None for an unknown user.
+    :type principal: Principal | None
+    :return: Serialized principal.
+    :rtype: bytes
+    """
+    if principal is None:
+        return orjson.dumps(None)
+    return orjson.dumps([
+        principal.id,
+        principal.email,
+        principal.username,
+        principal.confirmed,
+        principal.avatar,
+    ])
+
+
+def loads_principal(data: bytes) -> Principal | None:
+    fields = orjson.loads(data)
+    return None if fields is None else Principal(*fields)
+
+
+class UserCache:
+    """Two-tier cache of authenticated users.
+
+    Hot users are served from an in-process LRU without any network I/O,
+    the rest from the shared Redis ``v{version}:email:{email}`` entries,
+    which hold a :class:`Principal` rather than the ORM row. Writers call
+    :meth:`invalidate`, which drops the Redis entry and tells every worker
+    over pub/sub to evict its local copy.
+
+    Unknown users are cached as well, for ``negative_ttl`` seconds, and
+    :meth:`get_or_load` lets only one coroutine per email and worker query
+    the database on a miss.
+    """
+
+    channel = "users:invalidate"
+
+    def __init__(
+        self, maxsize: int, local_ttl: float, ttl: int, negative_ttl: int
+    ):
+        self.local = LRUCache(maxsize, local_ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # async client shared with the rate limiter, set on app startup
+        self.r: Redis | None = None
+        # a lock lives as long as some coroutine is loading its email
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"v{PRINCIPAL_VERSION}:email:{email}"
+
+    async def get(self, email: str) -> Principal | None | object:
+        """Looks the user up in the local tier first, then in Redis.
+
+        :param email: User email.
+        :type email: str
+        :return: Cached principal, None for a cached unknown user or
+            :data:`MISS` on a miss in both tiers.
+        :rtype: Principal | None | object
+        """
+        user = self.local.get(email, MISS)
+        if user is not MISS:
+            return user
+        data = await self.r.get(self.key(email))
+        if data is None:
+            return MISS
+        user = loads_principal(data)
+        self.local.set(email, user, ttl=self._local_ttl(user))
+        return user
+
+    async def set(self, email: str, user: Principal | None) -> None:
+        ttl = self.ttl if user is not None else self.negative_ttl
+        await self.r.set(self.key(email), dumps_principal(user), ex=ttl)
+        self.local.set(email, user, ttl=self._local_ttl(user))
+
+    async def get_or_load(
+        self,
+        email: str,
+        loader: Callable[[], Awaitable[Principal | None]],
+    ) -> Principal | None:
+        """Returns the cached user, loading and caching it on a miss.
+
+        Concurrent misses for the same email wait for the first loader
+        instead of each querying the database.
+
+        :param email: User email.
+        :type email: str
+        :param loader: Coroutine function fetching the user from storage.
+        :type loader: Callable[[], Awaitable[Principal | None]]
+        :return: Principal, or None if the user does not exist.
+        :rtype: Principal | None
+        """
+        user = await self.get(email)
+        if user is not MISS:
+            return user
+        lock = self._locks.get(email)
+        if lock is None:
+            lock = self._locks[email] = asyncio.Lock()
+        async with lock:
+            user = await self.get(email)
+            if user is MISS:
+                user = await loader()
+                await self.set(email, user)
+        return user
+
+    def _local_ttl(self, user: Principal | None) -> float:
+        if user is None:
+            return min(self.local.ttl, self.negative_ttl)
+        return self.local.ttl
+
+    async def invalidate(self, email: str) -> None:
+        """Drops the user from both tiers in every worker.
+
+        :param email: User email.
+        :type email: str
+        """
+        self.local.pop(email)
+        if self.r is None:
+            return
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.delete(self.key(email))
+            pipe.publish(self.channel, email)
+            await pipe.execute()
+
+    async def listen(self) -> None:
+        """Evicts local entries named on the invalidation channel.
+
+        Runs for the lifetime of the worker. After a lost connection the
+        local tier is cleared, as invalidations may have been missed.
+        """
+        while True:
+            try:
+                async with self.r.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.local.pop(message["data"].decode())
+            except ConnectionError:
+                self.local.clear()
+                await asyncio.sleep(1)
+
+
+async def fill_if_current(
+    r: Redis,
+    generation_key: str,
+    generation: int,
+    fill: Callable[[Any], None],
+) -> bool:
+    """Runs the commands ``fill`` queues on a transaction, unless a writer
+    bumped ``generation_key`` since ``generation`` was read.
+
+    Guards read-through fills: a write committing between the database
+    read and the fill would otherwise be overwritten with the old value.
+    """
+    async with r.pipeline() as pipe:
+        try:
+            await pipe.watch(generation_key)
+            if int(await pipe.get(generation_key) or 0) != generation:
+                return False
+            pipe.multi()
+            fill(pipe)
+            await pipe.execute()
+        except WatchError:
+            return False
+    return True
+
+
+class BirthdayCache:
+    """Upcoming-birthday lists per user, one Redis hash per user and day.
+
+    Hash fields are intervals in days, values the serialized response
+    body, so serving ``/contacts/birthday`` is a single HGET. Lists only
+    change when the day rolls over or a contact of the user is written,
+    and writers drop the whole hash through :meth:`invalidate`.
+
+    Writers also bump a per-user generation, fills pass the generation
+    read before querying and are dropped if it changed meanwhile.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        # async client shared with the rate limiter, set on app startup
+        self.r: Redis | None = None
+
+    @staticmethod
+    def key(user_id: int, day: date) -> str:
+        return f"birthdays:{day.isoformat()}:{user_id}"
+
+    @staticmethod
+    def generation_key(user_id: int) -> str:
+        return f"birthdays:generation:{user_id}"
+
+    async def generation(self, user_id: int) -> int:
+        if self.r is None:
+            return 0
+        return int(await self.r.get(self.generation_key(user_id)) or 0)
+
+    async def get(
+        self, user_id: int, interval: int, day: date
+    ) -> bytes | None:
+        if self.r is None:
+            return None
+        return await self.r.hget(self.key(user_id, day), str(interval))
+
+    async def set(
+        self,
+        user_id: int,
+        interval: int,
+        day: date,
+        data: bytes,
+        generation: int,
+    ) -> bool:
+        if self.r is None:
+            return False
+        key = self.key(user_id, day)
+
+        def fill(pipe):
+            pipe.hset(key, str(interval), data)
+            pipe.expire(key, self.ttl)
+
+        return await fill_if_current(
+            self.r, self.generation_key(user_id), generation, fill
+        )
+
+    async def invalidate(self, user_id: int) -> None:
+        if self.r is None:
+            return
+        generation_key = self.generation_key(user_id)
+        async with self.r.pipeline() as pipe:
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, self.ttl)
+            pipe.delete(self.key(user_id, date.today()))
+            await pipe.execute()
+
+
+CONTACT_FIELDS = (
+    "id",
+    "first_name",
+    "last_name",
+    "phone",
+    "email",
+    "birthday",
+    "version",
+)
+
+
+def dumps_contact(contact: Contact) -> bytes:
+    return orjson.dumps([getattr(contact, field) for field in CONTACT_FIELDS])
+
+
+def loads_contact(data: bytes, user_id: int) -> Contact:
+    fields = dict(zip(CONTACT_FIELDS, orjson.loads(data)))
+    if fields["birthday"] is not None:
+        fields["birthday"] = date.fromisoformat(fields["birthday"])
+    return Contact(**fields, user_id=user_id)
+
+
+class ContactCache:
+    """Read-through cache of single contacts in Redis.
+
+    Entries live under ``v{version}:contacts:{user_id}:{contact_id}`` for
+    ``ttl`` seconds. Contacts read from the cache are detached
+    :class:`Contact` instances. Writers bump a per-user generation, and a
+    fill is dropped when the generation changed after it was read, so a
+    row read before a concurrent write never replaces the invalidation.
+
+    Memory is bounded by the Redis instance: entries live on their own
+    instance when ``contact_cache_redis_host`` is set, which
+    docker-compose runs with ``maxmemory 256mb`` and ``maxmemory-policy
+    allkeys-lru``. Revocations, idempotency and rate limiter keys stay on
+    the main instance, which never evicts. An evicted generation key
+    reads as 0 and only drops fills that read another value.
+    """
+
+    def __init__(self, ttl: int, enabled: bool = True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # async client, its own instance if configured, set on app startup
+        self.r: Redis | None = None
+
+    @staticmethod
+    def key(user_id: int, contact_id: int) -> str:
+        return f"v{CONTACT_VERSION}:contacts:{user_id}:{contact_id}"
+
+    @staticmethod
+    def generation_key(user_id: int) -> str:
+        return f"v{CONTACT_VERSION}:contacts:{user_id}:generation"
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.r is not None
+
+    async def get(self, user_id: int, contact_id: int) -> Contact | None:
+        if not self.active:
+            return None
+        data = await self.r.get(self.key(user_id, contact_id))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return loads_contact(data, user_id)
+
+    async def generation(self, user_id: int) -> int:
+        if not self.active:
+            return 0
+        return int(await self.r.get(self.generation_key(user_id)) or 0)
+
+    async def set(self, contact: Contact, generation: int) -> bool:
+        if not self.active:
+            return False
+        key = self.key(contact.user_id, contact.id)
+        data = dumps_contact(contact)
+
+        def fill(pipe):
+            pipe.set(key, data, ex=self.ttl)
+
+        return await fill_if_current(
+            self.r, self.generation_key(contact.user_id), generation, fill
+        )
+
+    async def invalidate(self, user_id: int, *contact_ids: int) -> None:
+        if not self.active or not contact_ids:
+            return
+        generation_key = self.generation_key(user_id)
+        async with self.r.pipeline() as pipe:
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, self.ttl)
+            pipe.delete(
+                *(self.key(user_id, contact_id) for contact_id in contact_ids)
+            )
+            await pipe.execute()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class TokenCache:
+    """Claims of verified JWTs, kept in process until the token expires.
+
+    Keys are SHA-256 digests, so the tokens themselves are not kept in
+    memory. Only tokens that passed signature and claims verification
+    are stored.
+    """
+
+    def __init__(self, maxsize: int):
+        self.local = LRUCache(maxsize, ttl=0)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> dict | None:
+        claims = self.local.get(key)
+        if claims is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return claims
+
+    def set(self, key: bytes, claims: dict) -> None:
+        ttl = claims.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.local.set(key, claims, ttl=ttl)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.local),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class Idempotency:
+    """Results of non-idempotent requests, replayed to repeated ones.
+
+    The first request of a key claims it in Redis with SET NX and stores
+    its result when done. Repeats within ``ttl`` seconds get that result
+    without running again. A request that fails releases its key, so
+    retrying it runs it anew. Keys may be bound to a fingerprint of the
+    request, and reusing a key for a different request is refused.
+    """
+
+    def __init__(self, prefix: str, ttl: int):
+        self.prefix = prefix
+        self.ttl = ttl
+        # async client shared with the rate limiter, set on app startup
+        self.r: Redis | None = None
+
+    def key(self, key: str) -> str:
+        return f"idempotency:{self.prefix}:{key}"
+
+    async def run(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        fingerprint: str = "",
+    ) -> Any:
+        """Runs ``call`` once per key and ttl.
+
+        :param key: Idempotency key of the request.
+        :type key: str
+        :param call: Handles the request, returns a JSON serializable
+            result.
+        :type call: Callable[[], Awaitable[Any]]
+        :param fingerprint: Identifies the request made with the key.
+        :type fingerprint: str
+        :return: The result of ``call``, stored or fresh, or
+            :data:`PENDING` while the first request still runs.
+        :raises ValueError: The key was used for a different request.
+        """
+        if self.r is None:
+            return await call()
+        key = self.key(key)
+        claim = orjson.dumps({"fingerprint": fingerprint})
+        while not await self.r.set(key, claim, nx=True, ex=self.ttl):
+            data = await self.r.get(key)
+            if data is not None:
+                entry = orjson.loads(data)
+                if entry["fingerprint"] != fingerprint:
+                    raise ValueError("Key was used for a different request")
+                return entry.get("result", PENDING)
+            # expired since the SET NX, claim it again
+        try:
+            result = await call()
+        except BaseException:
+            await self.r.delete(key)
+            raise
+        data = {"fingerprint": fingerprint, "result": result}
+        await self.r.set(key, orjson.dumps(data), xx=True, keepttl=True)
+        return result
+
+
+class TokenRevocations:
+    """Minimum valid access-token version of users who revoked tokens.
+
+    Stateless access tokens carry the user's token version. Revoking bumps
+    the version in the database and records it here, so older tokens are
+    refused without any per-request storage lookup. Entries are only
+    needed until the revoked tokens expire, which keeps the set small
+    enough to hold in every worker. Workers share revocations over Redis,
+    ``auth:revoked:{user_id}`` keys for late joiners and pub/sub for the
+    running ones. The keys live on the main instance, which never evicts.
+
+    The local set is only complete while :meth:`listen` is subscribed and
+    has loaded the stored revocations, which :attr:`synced` tells. Until
+    then, callers check the token version in the database instead.
+    """
+
+    channel = "auth:revoked"
+
+    def __init__(self, ttl: int):
+        # lifetime of an access token
+        self.ttl = ttl
+        self.local: dict[int, tuple[float, int]] = {}
+        self.synced = False
+        # async client shared with the rate limiter, set on app startup
+        self.r: Redis | None = None
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"auth:revoked:{user_id}"
+
+    def is_revoked(self, user_id: int, version: int) -> bool:
+        entry = self.local.get(user_id)
+        if entry is None:
+            return False
+        expires_at, min_version = entry
+        if expires_at <= time.monotonic():
+            del self.local[user_id]
+            return False
+        return version < min_version
+
+    def _add(self, user_id: int, version: int, ttl: float) -> None:
+        now = time.monotonic()
+        entry = self.local.get(user_id)
+        if entry is not None and entry[0] > now:
+            version = max(version, entry[1])
+        self.local[user_id] = (now + ttl, version)
+        for key, (expires_at, _) in list(self.local.items()):
+            if expires_at <= now:
+                del self.local[key]
+
+    async def revoke(self, user_id: int, version: int) -> None:
+        """Refuses tokens of the user older than ``version`` everywhere.
+
+        :param user_id: User id.
+        :type user_id: int
+        :param version: The user's new token version.
+        :type version: int
+        """
+        self._add(user_id, version, self.ttl)
+        if self.r is None:
+            return
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.set(self.key(user_id), version, ex=self.ttl)
+            pipe.publish(self.channel, f"{user_id}:{version}")
+            await pipe.execute()
+
+    async def load(self) -> None:
+        async for key in self.r.scan_iter(match=self.key("*")):
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.ttl(key)
+                version, ttl = await pipe.execute()
+            if version is not None and ttl > 0:
+                user_id = int(key.rsplit(b":", 1)[1])
+                self._add(user_id, int(version), ttl)
+
+    async def listen(self) -> None:
+        """Applies revocations published by other workers.
+
+        Runs for the lifetime of the worker. The stored revocations are
+        reloaded after every (re)subscription, so none are missed while
+        disconnected.
+        """
+        while True:
+            try:
+                async with self.r.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    await self.load()
+                    self.synced = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            user_id, version = message["data"].split(b":")
+                            self._add(int(user_id), int(version), self.ttl)
+            except ConnectionError:
+                self.synced = False
+                await asyncio.sleep(1)
+
+
+user_cache = UserCache(
+    maxsize=settings.user_cache_maxsize,
+    local_ttl=settings.user_cache_local_ttl,
+    ttl=60 * 15,
+    negative_ttl=settings.user_cache_negative_ttl,
+)
+birthday_cache = BirthdayCache(ttl=60 * 60 * 24)
+contact_cache = ContactCache(
+    ttl=settings.contact_cache_ttl, enabled=settings.contact_cache_enabled
+)
+metrics.register("contact_cache", contact_cache.stats)
+token_cache = TokenCache(maxsize=settings.token_cache_maxsize)
+metrics.register("token_cache", token_cache.stats)
+# access tokens live 15 minutes, see Auth.create_access_token
+token_revocations = TokenRevocations(ttl=60 * 15)
+signup_idempotency = Idempotency(
+    "signup", ttl=settings.signup_idempotency_ttl
+)
+email_request_dedup = Idempotency(
+    "request_email", ttl=settings.email_request_dedup_ttl
+)
@@ -0,0 +1,99 @@
+"""Serializers streaming a user's contacts as NDJSON, CSV or vCard.
+
+Each takes the row chunks of :func:`repo_contacts.stream_contacts` and
+yields one encoded chunk per database chunk, so memory stays constant no
+matter how many contacts are exported.
+"""
+import csv
+import io
+from typing import AsyncIterator, Sequence
+
+import orjson
+from sqlalchemy import Row
+
+FIELDS = ("id", "first_name", "last_name", "phone", "email", "birthday")
+
+Chunks = AsyncIterator[Sequence[Row]]
+
+
+async def to_ndjson(chunks: Chunks) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b"".join(
+            orjson.dumps(row._asdict(), option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        )
+
+
+async def to_csv(chunks: Chunks) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # header only, the user has no contacts
+        yield buffer.getvalue().encode()
+
+
+def vcard_escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace(",", "\\,")
+        .replace(";", "\\;")
+        .replace("\n", "\\n")
+    )
+
+
+def vcard_line(line: str) -> str:
+    """Folds a content line at 75 octets of UTF-8 as RFC 6350 requires,
+    the leading space of continuation lines included, never splitting a
+    character."""
+    if line.isascii():
+        parts = [line[:75]]
+        parts += [line[i:i + 74] for i in range(75, len(line), 74)]
+        return "\r\n ".join(parts) + "\r\n"
+    parts = []
+    start, size, limit = 0, 0, 75
+    for i, char in enumerate(line):
+        octets = len(char.encode())
+        if size + octets > limit:
+            parts.append(line[start:i])
+            start, size, limit = i, 0, 74
+        size += octets
+    parts.append(line[start:])
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def vcard(row: Row) -> str:
+    first_name = vcard_escape(row.first_name)
+    last_name = vcard_escape(row.last_name)
+    lines = [
+        "BEGIN:VCARD",
+        "VERSION:3.0",
+        f"N:{last_name};{first_name};;;",
+        f"FN:{first_name} {last_name}",
+    ]
+    if row.phone:
+        lines.append(f"TEL;TYPE=CELL:{row.phone.removeprefix('tel:')}")
+    if row.email:
+        lines.append(f"EMAIL:{vcard_escape(row.email)}")
+    if row.birthday:
+        lines.append(f"BDAY:{row.birthday.isoformat()}")
+    lines.append("END:VCARD")
+    return "".join(vcard_line(line) for line in lines)
+
+
+async def to_vcard(chunks: Chunks) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield "".join(vcard(row) for row in rows).encode()
+
+
+# format -> (serializer, media type, file extension)
+FORMATS = {
+    "ndjson": (to_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (to_csv, "text/csv", "csv"),
+    "vcard": (to_vcard, "text/vcard", "vcf"),
+}
@@ -0,0 +1,305 @@
+"""Bulk contact import from CSV or NDJSON request bodies.
+
+The body is consumed as a stream and split into records without ever
+holding the whole upload in memory. Records are validated with
+:class:`ContactModel` and written in chunks, one multi-row INSERT and one
+transaction per chunk, so a failure late in a large file keeps the rows
+already imported.
+"""
+import codecs
+import csv
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repo_contacts
+from src.schemas.contacts import ContactModel, ImportReport, ImportRowError
+
+CSV_TYPES = ("text/csv",)
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+# lines buffered for csv.reader at a time
+READ_AHEAD = 256
+# characters, a record this long is rejected as a row error
+MAX_RECORD_SIZE = 64 * 1024
+
+
+async def iter_lines(
+    chunks: AsyncIterable[bytes],
+    max_line_size: int = MAX_RECORD_SIZE,
+) -> AsyncIterator[tuple[int, str | None]]:
+    """Decodes a byte stream as UTF-8 and yields numbered lines.
+
+    Lines longer than ``max_line_size`` characters are dropped while
+    they are read, so a body without line breaks is never buffered in
+    full, and yielded as None.
+
+    :param chunks: Raw body chunks.
+    :type chunks: AsyncIterable[bytes]
+    :param max_line_size: Maximum characters in a line, newline included.
+    :type max_line_size: int
+    :return: Pairs of 1-based line number and line, newline included,
+        or None for a line that is too long.
+    :rtype: AsyncIterator[tuple[int, str | None]]
+    :raises UnicodeDecodeError: If the body is not valid UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    async def texts() -> AsyncIterator[str]:
+        async for chunk in chunks:
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    # pieces of the current line and its length so far
+    number, parts, size = 0, [], 0
+    async for text in texts():
+        *lines, rest = text.split("\n")
+        for line in lines:
+            number += 1
+            size += len(line) + 1
+            if size > max_line_size:
+                yield number, None
+            else:
+                parts.append(line)
+                yield number, "".join(parts) + "\n"
+            parts, size = [], 0
+        size += len(rest)
+        if size <= max_line_size:
+            parts.append(rest)
+        else:
+            parts = []
+    if size > max_line_size:
+        yield number + 1, None
+    elif size:
+        yield number + 1, "".join(parts)
+
+
+class _NeedMore(Exception):
+    """Raised to csv.reader when a record runs past the buffered lines."""
+
+
+class _LineTooLong(Exception):
+    """Raised to csv.reader when a record reaches a line that was too
+    long to buffer."""
+
+
+async def iter_csv_rows(
+    lines: AsyncIterator[tuple[int, str | None]],
+    max_record_size: int = MAX_RECORD_SIZE,
+) -> AsyncIterator[tuple[int, list[str] | str]]:
+    """Parses CSV records from a line stream with :mod:`csv`.
+
+    Lines are read ahead in blocks and handed to :class:`csv.reader`,
+    which decides where records end, quoted line breaks included. A
+    record running past the block is parsed again once more lines are
+    buffered, so only records crossing a block boundary are parsed
+    twice. Records longer than ``max_record_size`` characters, like
+    everything after a quote that is never closed, are reported and
+    skipped, which keeps memory bounded. So are records reaching a line
+    :func:`iter_lines` found too long.
+
+    :param lines: Numbered lines from :func:`iter_lines`.
+    :type lines: AsyncIterator[tuple[int, str | None]]
+    :param max_record_size: Maximum characters in a single record.
+    :type max_record_size: int
+    :return: Pairs of starting line number and either the fields or an
+        error message.
+    :rtype: AsyncIterator[tuple[int, list[str] | str]]
+    """
+    buffer: deque[str | None] = deque()
+    exhausted = False
+    # lines consumed by the records parsed so far
+    number = 0
+
+    async def read_ahead(count: int) -> None:
+        nonlocal exhausted
+        for _ in range(count):
+            try:
+                _, line = await anext(lines)
+            except StopAsyncIteration:
+                exhausted = True
+                return
+            buffer.append(line)
+
+    def feed(taken: list[str]) -> Iterator[str]:
+        while buffer:
+            line = buffer.popleft()
+            if line is None:
+                raise _LineTooLong
+            taken.append(line)
+            yield line
+        if not exhausted:
+            raise _NeedMore
+
+    while True:
+        if not buffer:
+            if exhausted:
+                return
+            await read_ahead(READ_AHEAD)
+            continue
+        taken = []
+        reader = csv.reader(feed(taken))
+        try:
+            row = next(reader, [])
+        except _NeedMore:
+            if sum(map(len, taken)) > max_record_size:
+                yield number + 1, "Record too large"
+                number += len(taken)
+                continue
+            buffer.extendleft(reversed(taken))
+            # grow with the record, so long records are parsed few times
+            await read_ahead(max(len(taken), READ_AHEAD))
+            continue
+        except _LineTooLong:
+            yield number + 1, "Record too large"
+            # the lines taken and the one too long
+            number += len(taken) + 1
+            continue
+        except csv.Error as e:
+            row = f"Invalid CSV: {e}"
+        if sum(map(len, taken)) > max_record_size:
+            row = "Record too large"
+        yield number + 1, row
+        number += reader.line_num
+
+
+def parse_csv(
+    header: list[str], rows: list[tuple[int, list[str] | str]]
+) -> Iterable[tuple[int, dict | str]]:
+    """Turns CSV rows into field dicts keyed by the header.
+
+    :return: Pairs of line number and either the fields or an error.
+    :rtype: Iterable[tuple[int, dict | str]]
+    """
+    for number, row in rows:
+        if isinstance(row, str):
+            yield number, row
+            continue
+        if not row:
+            continue
+        if len(row) != len(header):
+            yield number, (
+                f"Row has {len(row)} fields, expected {len(header)}"
+            )
+            continue
+        yield number, {
+            key: value or None for key, value in zip(header, row)
+        }
+
+
+def parse_ndjson(
+    records: list[tuple[int, str | None]],
+) -> Iterable[tuple[int, dict | str]]:
+    for number, record in records:
+        if record is None:
+            yield number, "Record too large"
+            continue
+        if not record.strip():
+            continue
+        try:
+            fields = orjson.loads(record)
+        except orjson.JSONDecodeError as e:
+            yield number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(fields, dict):
+            yield number, "Expected a JSON object"
+            continue
+        yield number, fields
+
+
+async def import_contacts(
+    chunks: AsyncIterable[bytes],
+    content_type: str,
+    user: User,
+    db: AsyncSession,
+    chunk_size: int = 1000,
+    max_errors: int = 100,
+) -> ImportReport:
+    """Validates and inserts the contacts of a CSV or NDJSON stream.
+
+    CSV bodies need a header line naming the :class:`ContactModel`
+    fields, in any order. Invalid rows are skipped and reported by line.
+
+    :param chunks: Raw body chunks.
+    :type chunks: AsyncIterable[bytes]
+    :param content_type: Media type of the body, e.g. ``text/csv``.
+    :type content_type: str
+    :param user: The owner of the contacts.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param chunk_size: Records per INSERT and transaction.
+    :type chunk_size: int
+    :param max_errors: Maximum number of row errors in the report.
+    :type max_errors: int
+    :return: Counts of created and failed rows and the row errors.
+    :rtype: ImportReport
+    :raises ValueError: If the media type is not supported or the CSV
+        header is missing or unknown.
+    :raises UnicodeDecodeError: If the body is not valid UTF-8.
+    """
+    if content_type in CSV_TYPES:
+        records = iter_csv_rows(iter_lines(chunks))
+        header = None
+    elif content_type in NDJSON_TYPES:
+        records = iter_lines(chunks)
+    else:
+        raise ValueError(f"Unsupported media type {content_type!r}")
+
+    report = ImportReport(created=0, failed=0, errors=[])
+
+    def fail(number: int, errors: list[dict]) -> None:
+        report.failed += 1
+        if len(report.errors) < max_errors:
+            report.errors.append(ImportRowError(line=number, errors=errors))
+
+    async def flush(batch: list[tuple[int, list[str] | str]]) -> None:
+        if content_type in CSV_TYPES:
+            rows = parse_csv(header, batch)
+        else:
+            rows = parse_ndjson(batch)
+        bodies = []
+        for number, fields in rows:
+            if isinstance(fields, str):
+                fail(number, [{"msg": fields}])
+                continue
+            try:
+                bodies.append(ContactModel.model_validate(fields))
+            except ValidationError as e:
+                fail(
+                    number,
+                    e.errors(
+                        include_url=False,
+                        include_context=False,
+                        include_input=False,
+                    ),
+                )
+        if bodies:
+            report.created += await repo_contacts.create_contacts(
+                bodies, user, db
+            )
+
+    batch = []
+    async for number, record in records:
+        if content_type in CSV_TYPES and header is None:
+            if isinstance(record, str):
+                raise ValueError(f"Invalid CSV header: {record}")
+            header = [name.strip() for name in record]
+            if not header:
+                raise ValueError("Missing CSV header")
+            unknown = set(header) - set(ContactModel.model_fields)
+            if unknown:
+                raise ValueError(
+                    f"Invalid CSV header, unknown columns: {sorted(unknown)}"
+                )
+            continue
+        batch.append((number, record))
+        if len(batch) >= chunk_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return report
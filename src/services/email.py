@@ -1,40 +1,274 @@
+"""Confirmation emails.
+
+API workers only enqueue messages with :func:`send_email`. The mail
+worker (:mod:`src.services.email_worker`) renders and delivers them over
+pooled SMTP connections, so SMTP latency and outages never hold up
+requests and failed sends are retried.
+"""
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi import BackgroundTasks
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import orjson
+from jinja2 import Environment, FileSystemLoader, nodes, select_autoescape
+from markupsafe import escape
 from pydantic import EmailStr
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
 
 from src.conf.config import settings
 from src.services.auth import auth_service
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME=settings.mail_from_name,
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+class Variable(str):
+    """Name of a variable among the static parts of a template."""
+
+
+class TemplateRegistry:
+    """Email templates compiled once per process.
+
+    Templates made of plain text and ``{{ name }}`` substitutions only,
+    like the confirmation email, are also split into their static parts,
+    so rendering them is a single join instead of a Jinja render. Any
+    other template falls back to its compiled Jinja form.
+
+    With ``reload`` on, as in development, a template is recompiled when
+    its file changes; otherwise files are never checked again.
+    """
+
+    def __init__(self, folder: Path, reload: bool = False):
+        self.reload = reload
+        self.environment = Environment(
+            loader=FileSystemLoader(folder),
+            autoescape=select_autoescape(),
+            auto_reload=reload,
+        )
+        # name -> (template, static parts or None, uptodate check)
+        self.compiled: dict[str, tuple] = {}
+
+    def load(self) -> None:
+        """Compiles every template in the folder, called on startup."""
+        for name in self.environment.list_templates():
+            self.compile(name)
+
+    def compile(self, name: str) -> tuple:
+        environment = self.environment
+        source, _, uptodate = environment.loader.get_source(environment, name)
+        template = environment.get_template(name)
+        entry = (template, self.static_parts(source), uptodate)
+        self.compiled[name] = entry
+        return entry
+
+    def static_parts(self, source: str) -> list | None:
+        """Text and variable names of the template in order, None if it
+        uses anything besides plain substitutions."""
+        parts = []
+        for node in self.environment.parse(source).body:
+            if not isinstance(node, nodes.Output):
+                return None
+            for child in node.nodes:
+                if isinstance(child, nodes.TemplateData):
+                    parts.append(child.data)
+                elif isinstance(child, nodes.Name):
+                    parts.append(Variable(child.name))
+                else:
+                    return None
+        return parts
+
+    def render(self, name: str, /, **context) -> str:
+        entry = self.compiled.get(name)
+        if entry is None or self.reload and not entry[2]():
+            entry = self.compile(name)
+        template, parts, _ = entry
+        if parts is None:
+            return template.render(context)
+        if self.environment.autoescape(name):
+            fill = escape
+        else:
+            fill = str
+        return "".join(
+            fill(context.get(part, "")) if type(part) is Variable else part
+            for part in parts
+        )
+
+
+templates = TemplateRegistry(
+    TEMPLATE_FOLDER, reload=settings.email_templates_reload
 )
 
 
-async def send_email(email: EmailStr, username: str, host: str):
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username,
-                           "token": token_verification},
-            subtype=MessageType.html
+def build_message(job: dict) -> EmailMessage:
+    """Renders a queued confirmation email.
+
+    The verification token is created here rather than on enqueue, so a
+    retried message still carries a fresh token.
+
+    :param job: The queued job, see :func:`send_email`.
+    :type job: dict
+    :return: The message ready to send.
+    :rtype: EmailMessage
+    """
+    token = auth_service.create_email_token({"sub": job["email"]})
+    html = templates.render(
+        job["template"],
+        host=job["host"],
+        username=job["username"],
+        token=token,
+    )
+    message = EmailMessage()
+    message["Subject"] = job["subject"]
+    message["From"] = formataddr((settings.mail_from_name, settings.mail_from))
+    message["To"] = job["email"]
+    message.set_content(html, subtype="html")
+    return message
+
+
+class EmailQueue:
+    """Outgoing emails, a Redis stream read by the ``mailer`` group.
+
+    Entries stay pending until a worker acknowledges them, so the batch
+    of a worker that died mid-send is claimed by another one after
+    ``claim_idle`` milliseconds. Live workers :meth:`touch` the entries
+    they are still sending, so a slow batch is not claimed. Failed sends
+    wait in the ``email:retry`` sorted set, scored by due time, with
+    exponential backoff. Jobs still failing after ``max_attempts`` end up
+    in the ``email:failed`` list. Key names start with ``prefix``,
+    ``email`` by default.
+    """
+
+    group = "mailer"
+
+    def __init__(
+        self,
+        max_attempts: int,
+        backoff: float,
+        claim_idle: int = 60_000,
+        prefix: str = "email",
+    ):
+        self.stream = f"{prefix}:queue"
+        self.retries = f"{prefix}:retry"
+        self.failed = f"{prefix}:failed"
+        self.max_attempts = max_attempts
+        # seconds before the first retry, doubled for every next one
+        self.backoff = backoff
+        self.claim_idle = claim_idle
+        # async client shared with the rate limiter, set on app startup
+        self.r: Redis | None = None
+
+    async def push(self, job: dict) -> None:
+        await self.r.xadd(self.stream, {"job": orjson.dumps(job)})
+
+    async def create_group(self) -> None:
+        try:
+            await self.r.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    async def read(
+        self, consumer: str, count: int, block: int
+    ) -> list[tuple[bytes, dict]]:
+        """Next batch of jobs for ``consumer``, abandoned ones first.
+
+        :param consumer: Name of the worker in the consumer group.
+        :type consumer: str
+        :param count: Maximum number of jobs.
+        :type count: int
+        :param block: Milliseconds to wait for new jobs.
+        :type block: int
+        :return: Stream entry ids and jobs.
+        :rtype: list[tuple[bytes, dict]]
+        """
+        _, entries, *_ = await self.r.xautoclaim(
+            self.stream, self.group, consumer, self.claim_idle, count=count
+        )
+        if not entries:
+            response = await self.r.xreadgroup(
+                self.group, consumer, {self.stream: ">"},
+                count=count, block=block,
+            )
+            entries = response[0][1] if response else []
+        return [
+            (entry_id, orjson.loads(fields[b"job"]))
+            for entry_id, fields in entries
+            if fields
+        ]
+
+    async def touch(self, consumer: str, entry_ids: list[bytes]) -> None:
+        """Resets the idle time of entries ``consumer`` is still sending,
+        so other workers do not claim them as abandoned."""
+        await self.r.xclaim(
+            self.stream, self.group, consumer, 0, entry_ids, justid=True
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    async def finish(
+        self, entry_ids: list[bytes], failures: list[tuple[dict, str]]
+    ) -> list[dict]:
+        """Acknowledges a batch and schedules retries of its failed jobs.
+
+        Both happen in one transaction, so a worker dying in between
+        neither leaves a retried job pending in the stream, to be sent
+        again when claimed, nor loses it.
+
+        :param entry_ids: Stream entry ids of the whole batch.
+        :type entry_ids: list[bytes]
+        :param failures: Failed jobs and their errors.
+        :type failures: list[tuple[dict, str]]
+        :return: The jobs that ran out of attempts and were moved to the
+            failed list instead, with their last error.
+        :rtype: list[dict]
+        """
+        given_up = []
+        async with self.r.pipeline() as pipe:
+            for job, error in failures:
+                attempt = job.get("attempt", 0) + 1
+                if attempt >= self.max_attempts:
+                    job = {**job, "error": error}
+                    pipe.lpush(self.failed, orjson.dumps(job))
+                    given_up.append(job)
+                    continue
+                due = time.time() + self.backoff * 2 ** (attempt - 1)
+                data = orjson.dumps({**job, "attempt": attempt})
+                pipe.zadd(self.retries, {data: due})
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            await pipe.execute()
+        return given_up
+
+    async def requeue_due(self) -> int:
+        """Moves retries whose backoff has passed back to the stream."""
+        count = 0
+        for data in await self.r.zrangebyscore(
+            self.retries, "-inf", time.time()
+        ):
+            # only the worker that removed the retry requeues it
+            if await self.r.zrem(self.retries, data):
+                await self.r.xadd(self.stream, {"job": data})
+                count += 1
+        return count
+
+
+email_queue = EmailQueue(
+    max_attempts=settings.email_max_attempts,
+    backoff=settings.email_retry_backoff,
+)
+
+
+async def send_email(email: EmailStr, username: str, host: str):
+    """Queues the confirmation email of a user.
+
+    :raises RedisError: If the queue is unreachable, the email is not
+        queued and the caller decides how to report it.
+    """
+    await email_queue.push({
+        "template": "email_template.html",
+        "subject": "Confirm your email ",
+        "email": email,
+        "username": username,
+        "host": str(host),
+    })
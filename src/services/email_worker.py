@@ -0,0 +1,175 @@
+"""Mail worker delivering the emails queued by the API.
+
+Run next to the API, one or more processes::
+
+    python -m src.services.email_worker
+
+Each worker reads batches from the ``email:queue`` stream and sends them
+concurrently over a small pool of persistent SMTP connections.
+"""
+import asyncio
+import logging
+import os
+import socket
+from email.message import EmailMessage
+
+import aiosmtplib
+import redis.asyncio as redis
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
+from src.services.email import (
+    EmailQueue,
+    build_message,
+    email_queue,
+    templates,
+)
+
+logger = logging.getLogger(__name__)
+
+# milliseconds an idle worker waits for new jobs before checking retries
+BLOCK = 1000
+
+
+class SMTPPool:
+    """Persistent SMTP connections shared by concurrent sends.
+
+    Connections open on first use and stay open between batches. A
+    connection the server dropped while idle is reopened and the send
+    tried once more before the error counts as a failed attempt.
+    """
+
+    def __init__(self, size: int, **options):
+        self.size = size
+        # keyword arguments of aiosmtplib.SMTP
+        self.options = options
+        self.opened = 0
+        self.idle: asyncio.LifoQueue[aiosmtplib.SMTP] = asyncio.LifoQueue()
+
+    async def _send(
+        self, client: aiosmtplib.SMTP, message: EmailMessage
+    ) -> None:
+        if not client.is_connected:
+            await client.connect()
+        await client.send_message(message)
+
+    async def send(self, message: EmailMessage) -> None:
+        if self.idle.empty() and self.opened < self.size:
+            self.opened += 1
+            client = aiosmtplib.SMTP(**self.options)
+        else:
+            client = await self.idle.get()
+        try:
+            try:
+                await self._send(client, message)
+            except aiosmtplib.SMTPServerDisconnected:
+                client.close()
+                await self._send(client, message)
+        except aiosmtplib.SMTPException:
+            client.close()
+            raise
+        finally:
+            self.idle.put_nowait(client)
+
+    async def close(self) -> None:
+        while not self.idle.empty():
+            client = self.idle.get_nowait()
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+        self.opened = 0
+
+
+class EmailWorker:
+    def __init__(
+        self,
+        queue: EmailQueue,
+        pool: SMTPPool,
+        consumer: str,
+        batch_size: int,
+    ):
+        self.queue = queue
+        self.pool = pool
+        self.consumer = consumer
+        self.batch_size = batch_size
+
+    async def deliver(self, job: dict) -> None:
+        await self.pool.send(build_message(job))
+
+    async def keep_claimed(self, entry_ids: list[bytes]) -> None:
+        """Touches the batch being sent well within ``claim_idle``."""
+        while True:
+            await asyncio.sleep(self.queue.claim_idle / 3000)
+            try:
+                await self.queue.touch(self.consumer, entry_ids)
+            except ConnectionError:
+                logger.warning("Could not refresh the claim on a batch")
+
+    async def run_once(self, block: int = BLOCK) -> int:
+        """Delivers one batch, scheduling retries for failed sends.
+
+        :param block: Milliseconds to wait for new jobs.
+        :type block: int
+        :return: The number of jobs handled.
+        :rtype: int
+        """
+        await self.queue.requeue_due()
+        entries = await self.queue.read(self.consumer, self.batch_size, block)
+        if not entries:
+            return 0
+        entry_ids = [entry_id for entry_id, _ in entries]
+        keepalive = asyncio.create_task(self.keep_claimed(entry_ids))
+        try:
+            results = await asyncio.gather(
+                *(self.deliver(job) for _, job in entries),
+                return_exceptions=True,
+            )
+        finally:
+            keepalive.cancel()
+        failures = [
+            (job, repr(result))
+            for (_, job), result in zip(entries, results)
+            if isinstance(result, Exception)
+        ]
+        for job in await self.queue.finish(entry_ids, failures):
+            logger.error(
+                "Giving up on email to %s: %s", job["email"], job["error"]
+            )
+        return len(entries)
+
+    async def run(self) -> None:
+        await self.queue.create_group()
+        while True:
+            await self.run_once()
+
+
+async def main() -> None:
+    templates.load()
+    email_queue.r = redis.Redis(
+        host=settings.redis_host, port=settings.redis_port, db=0
+    )
+    pool = SMTPPool(
+        settings.email_smtp_pool_size,
+        hostname=settings.mail_server,
+        port=settings.mail_port,
+        username=settings.mail_username,
+        password=settings.mail_password,
+        use_tls=True,
+    )
+    worker = EmailWorker(
+        email_queue,
+        pool,
+        consumer=f"{socket.gethostname()}-{os.getpid()}",
+        batch_size=settings.email_batch_size,
+    )
+    try:
+        await worker.run()
+    finally:
+        await pool.close()
+        await email_queue.r.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Entity tags for conditional contact requests.
+
+A contact's tag is its row version, bumped by every write. Collections
+are tagged with a digest of the ``(id, version)`` pairs they contain, so
+adding, changing or removing a contact changes the tag.
+"""
+import hashlib
+from typing import Iterable
+
+import orjson
+
+
+def contact_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def collection_etag(
+    versions: Iterable[tuple[int, int]], *extra: object
+) -> str:
+    data = orjson.dumps([list(versions), extra])
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def parse_etags(header: str | None) -> list[str]:
+    """Splits an ``If-Match`` / ``If-None-Match`` header into tags.
+
+    :param header: Header value, None if the header is absent.
+    :type header: str | None
+    :return: Tags as sent, weak ones keep their ``W/`` prefix.
+    :rtype: list[str]
+    """
+    if not header:
+        return []
+    tags = (tag.strip() for tag in header.split(","))
+    return [tag for tag in tags if tag]
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Weak comparison, as ``If-None-Match`` requires."""
+    tags = [tag.removeprefix("W/") for tag in parse_etags(header)]
+    return "*" in tags or etag in tags
+
+
+def parse_versions(header: str) -> list[int]:
+    """Contact versions named by an ``If-Match`` header, ``*`` ignored.
+
+    ``If-Match`` uses strong comparison, so weak tags never match a
+    version. Malformed tags cannot match either and are skipped.
+    """
+    versions = []
+    for tag in parse_etags(header):
+        if tag.startswith("W/"):
+            continue
+        value = tag.strip('"')
+        if value.isdigit():
+            versions.append(int(value))
+    return versions
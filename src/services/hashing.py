@@ -0,0 +1,88 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+from src.services import metrics
+
+
+class HashingPool:
+    """Bounded thread pool running password hashing off the event loop.
+
+    bcrypt releases the GIL, so threads give real parallelism here. Calls
+    beyond ``workers + queue_size`` in flight are refused with a 503
+    instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hashing"
+        )
+        self.limit = workers + queue_size
+        self.pending = 0
+        self.rejected = 0
+        self.queue_wait = metrics.Histogram()
+        self.hash_time = metrics.Histogram()
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Runs ``func(*args)`` in the pool.
+
+        :param func: Blocking hashing function.
+        :type func: Callable
+        :return: Result of ``func``.
+        :rtype: Any
+        :raises HTTPException: 503 if the pool queue is full.
+        """
+        if self.pending >= self.limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = func(*args)
+            return result, started, time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(timed)
+        except BaseException:
+            self.pending -= 1
+            raise
+        # released when the job leaves the pool, not when its caller
+        # does: a cancelled caller drops a queued job right away, while a
+        # running one holds its thread until done
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release)
+        )
+        result, started, finished = await asyncio.wrap_future(future)
+        self.queue_wait.observe(started - submitted)
+        self.hash_time.observe(finished - started)
+        return result
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "limit": self.limit,
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "hash_time": self.hash_time.snapshot(),
+        }
+
+
+hashing_pool = HashingPool(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+)
+metrics.register("password_hashing", hashing_pool.stats)
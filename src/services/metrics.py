@@ -0,0 +1,52 @@
+from bisect import bisect_left
+from typing import Callable
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+registry: dict[str, Callable[[], dict]] = {}
+
+
+class Histogram:
+    """Cumulative histogram of observed durations in seconds.
+
+    Kept per process, so every gunicorn worker reports its own numbers.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        buckets = {}
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+def register(name: str, collector: Callable[[], dict]) -> None:
+    """Registers a callable returning a snapshot of the named metrics.
+
+    :param name: Name the snapshot is exported under.
+    :type name: str
+    :param collector: Callable returning a JSON serializable dict.
+    :type collector: Callable[[], dict]
+    """
+    registry[name] = collector
+
+
+def collect() -> dict:
+    """Collects the snapshots of all registered metrics.
+
+    :return: Mapping of metric name to its snapshot.
+    :rtype: dict
+    """
+    return {name: collector() for name, collector in registry.items()}
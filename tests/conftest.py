@@ -1,13 +1,16 @@
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.db import get_db
 from src.database.models import Base
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -15,6 +18,13 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
 )
+# NullPool: every test event loop gets its own aiosqlite connection
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool
+)
+AsyncTestingSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 
 
 def base_session():
@@ -34,6 +44,20 @@ def base_session():
         db.close()
 
 
+async def base_async_session():
+    """Async counterpart of :func:`base_session` for repository tests
+    running in unittest IsolatedAsyncioTestCase classes
+
+    :yield: AsyncSession object for db connection
+    :rtype: AsyncGenerator[AsyncSession, None]
+    """
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="module")
 def session():
     # Create the database for pytest tests
@@ -44,11 +68,9 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as client:
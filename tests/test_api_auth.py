@@ -1,10 +1,41 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
 
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
 from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import (
+    email_request_dedup,
+    signup_idempotency,
+    token_revocations,
+)
+
+SIGNUP_KEY = "signup-wolverine"
+SIGNUP_EMAILS = ("wolverine@example.com", "logan@example.com")
+DEDUP_EMAILS = ("nobody@example.com", "wolverine@example.com")
+
+
+@pytest.fixture(autouse=True)
+def idempotency_keys():
+    # the stored results outlive the test database, so a rerun within
+    # their ttl would replay them instead of running the requests
+    keys = [
+        signup_idempotency.key(f"{email}:{SIGNUP_KEY}")
+        for email in SIGNUP_EMAILS
+    ]
+    keys += [email_request_dedup.key(email) for email in DEDUP_EMAILS]
+    r = Redis(host=settings.redis_host, port=settings.redis_port)
+    r.delete(*keys)
+    yield
+    r.delete(*keys)
+    r.close()
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.api.auth.send_email", mock_send_email)
     respose = client.post("api/v1/auth/signup", json=user)
     assert respose.status_code == 201, respose.text
@@ -13,6 +44,33 @@ def test_create_user(client, user, monkeypatch):
     assert "id" in data["user"]
 
 
+def test_create_user_idempotency_key(client, monkeypatch):
+    mock_send_email = AsyncMock()
+    monkeypatch.setattr("src.api.auth.send_email", mock_send_email)
+    body = {
+        "username": "wolverine",
+        "email": "wolverine@example.com",
+        "password": "123456789",
+    }
+    headers = {"Idempotency-Key": SIGNUP_KEY}
+    first = client.post("api/v1/auth/signup", json=body, headers=headers)
+    assert first.status_code == 201, first.text
+    repeat = client.post("api/v1/auth/signup", json=body, headers=headers)
+    assert repeat.status_code == 201, repeat.text
+    assert repeat.json() == first.json()
+    assert mock_send_email.call_count == 1
+
+    other = {**body, "password": "987654321"}
+    response = client.post("api/v1/auth/signup", json=other, headers=headers)
+    assert response.status_code == 422, response.text
+
+    # keys are scoped to the email, another client may use the same one
+    other = {**body, "username": "logan", "email": "logan@example.com"}
+    response = client.post("api/v1/auth/signup", json=other, headers=headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["user"]["email"] == "logan@example.com"
+
+
 def test_repeat_create_user(client, user):
     respose = client.post("api/v1/auth/signup", json=user)
     assert respose.status_code == 409, respose.text
@@ -35,6 +93,7 @@ def test_login_user(client, session, user):
         session.query(User).filter(User.email == user.get("email")).first()
     )
     current_user.confirmed = True
+    session.commit()
     response = client.post(
         "api/v1/auth/login",
         data={"username": user.get("email"), "password": user.get("password")},
@@ -62,3 +121,88 @@ def test_login_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def test_logout_revokes_stateless_token(client, user, monkeypatch):
+    monkeypatch.setattr(auth_service, "STATELESS", True)
+    response = client.post(
+        "api/v1/auth/login",
+        data={"username": user.get("email"), "password": user.get("password")},
+    )
+    assert response.status_code == 200, response.text
+    access_token = response.json()["access_token"]
+    claims = auth_service.decode_token(access_token)
+    assert claims["name"] == user.get("username")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    contact = {
+        "first_name": "John",
+        "last_name": "Wick",
+        "phone": "+380930000000",
+    }
+    response = client.post("api/v1/contacts/", json=contact, headers=headers)
+    assert response.status_code == 201, response.text
+
+    response = client.post("api/v1/auth/logout", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.post("api/v1/contacts/", json=contact, headers=headers)
+    assert response.status_code == 401, response.text
+
+
+def test_stateless_token_checked_in_db_until_synced(
+    client, session, user, monkeypatch
+):
+    monkeypatch.setattr(auth_service, "STATELESS", True)
+    response = client.post(
+        "api/v1/auth/login",
+        data={"username": user.get("email"), "password": user.get("password")},
+    )
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    # revoked by a worker whose message this one never got
+    current_user: User = (
+        session.query(User).filter(User.email == user.get("email")).first()
+    )
+    current_user.token_version += 1
+    session.commit()
+
+    response = client.post("api/v1/auth/logout", headers=headers)
+    assert response.status_code == 401, response.text
+    monkeypatch.setattr(token_revocations, "synced", True)
+    # the logout below revokes in a set dropped after the test
+    monkeypatch.setattr(token_revocations, "local", {})
+    response = client.post("api/v1/auth/logout", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_request_email_deduplicated(client, user, monkeypatch):
+    mock_send_email = AsyncMock()
+    monkeypatch.setattr("src.api.auth.send_email", mock_send_email)
+    for _ in range(3):
+        response = client.post(
+            "api/v1/auth/request_email", json={"email": "nobody@example.com"}
+        )
+        assert response.status_code == 200, response.text
+    response = client.post(
+        "api/v1/auth/request_email",
+        json={"email": "wolverine@example.com"},
+    )
+    assert response.status_code == 200, response.text
+    response = client.post(
+        "api/v1/auth/request_email",
+        json={"email": "WOLVERINE@example.com"},
+    )
+    assert response.json() == {"message": "Check your email for confirmation."}
+    assert mock_send_email.call_count == 1
+
+
+def test_request_email_queue_down(client, monkeypatch):
+    mock_send_email = AsyncMock(side_effect=ConnectionError("down"))
+    monkeypatch.setattr("src.api.auth.send_email", mock_send_email)
+    body = {"email": "wolverine@example.com"}
+    response = client.post("api/v1/auth/request_email", json=body)
+    assert response.status_code == 503, response.text
+    # the failure is not remembered by the dedup
+    mock_send_email.side_effect = None
+    response = client.post("api/v1/auth/request_email", json=body)
+    assert response.status_code == 200, response.text
+    assert mock_send_email.await_count == 2
@@ -1,9 +1,13 @@
 import asyncio
-from unittest.mock import MagicMock
+import csv
+import io
+import json
+from unittest.mock import AsyncMock
 
 import pytest
 
 from src.database.models import User
+from src.services.cache import contact_cache
 
 contact = {
     "first_name": "Maksym",
@@ -16,7 +20,7 @@ contact = {
 
 @pytest.fixture
 def token(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.api.auth.send_email", mock_send_email)
     response = client.post("api/v1/auth/signup", json=user)
     current_user: User = (
@@ -79,7 +83,7 @@ def test_list_contacts_with_param(client, token, param, value):
     )
     assert response.status_code == 200, response.text
     data = response.json()
-    assert data[param] == value
+    assert [contact[param] for contact in data] == [value]
 
 
 @pytest.mark.parametrize(
@@ -98,3 +102,437 @@ def test_list_contacts_wrong_param(client, token, param, value):
     assert response.status_code == 404
     data = response.json()
     assert data["detail"] == "There is no contacts"
+
+
+def test_search_contacts(client, token):
+    response = client.get(
+        "api/v1/contacts/search?q=kl",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [contact["last_name"] for contact in data] == [contact["last_name"]]
+
+
+def test_search_contacts_skip_bounds(client, token):
+    response = client.get(
+        "api/v1/contacts/search?q=kl&skip=-1",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_search_contacts_not_found(client, token):
+    response = client.get(
+        "api/v1/contacts/search?q=nobody",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 404, response.text
+
+
+def test_list_contacts_cursor(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    second = {**contact, "first_name": "Second", "phone": "+380936644886"}
+    response = client.post("api/v1/contacts/", json=second, headers=headers)
+    assert response.status_code == 201, response.text
+
+    response = client.get(
+        "api/v1/contacts/?cursor=&limit=1", headers=headers
+    )
+    assert response.status_code == 200, response.text
+    first_page = response.json()
+    assert first_page["items"][0]["first_name"] == contact["first_name"]
+    assert first_page["next_cursor"]
+
+    response = client.get(
+        f"api/v1/contacts/?cursor={first_page['next_cursor']}&limit=1",
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    second_page = response.json()
+    assert second_page["items"][0]["first_name"] == second["first_name"]
+    assert second_page["next_cursor"] is None
+
+
+def test_list_contacts_invalid_cursor(client, token):
+    response = client.get(
+        "api/v1/contacts/?cursor=garbage",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400, response.text
+
+
+def test_list_contacts_limit_bounds(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    for query in (
+        "cursor=&limit=-1", "cursor=&limit=0", "limit=1001", "skip=-1"
+    ):
+        response = client.get(f"api/v1/contacts/?{query}", headers=headers)
+        assert response.status_code == 422, response.text
+
+
+def test_list_contacts_combined_filters(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(
+        "api/v1/contacts/?last_name=klym&sort_by=first_name",
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["first_name"] for item in data] == [
+        contact["first_name"],
+        "Second",
+    ]
+
+    response = client.get(
+        "api/v1/contacts/?last_name=klym&first_name=second",
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert [item["first_name"] for item in response.json()] == ["Second"]
+
+
+def test_birthday_digest_follows_contact_writes(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        "api/v1/contacts/",
+        json={**contact, "first_name": "Birthday"},
+        headers=headers,
+    )
+    assert response.status_code == 201, response.text
+    contact_id = response.json()["id"]
+
+    response = client.get(
+        "api/v1/contacts/birthday?interval=365", headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert contact_id in [item["id"] for item in response.json()]
+
+    response = client.delete(f"api/v1/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get(
+        "api/v1/contacts/birthday?interval=365", headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert contact_id not in [item["id"] for item in response.json()]
+
+
+def test_birthday_interval_too_large(client, token):
+    response = client.get(
+        "api/v1/contacts/birthday?interval=366",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 422, response.text
+
+
+def test_import_contacts_csv(client, token):
+    body = (
+        "first_name,last_name,phone,email,birthday\n"
+        "Ada,Lovelace,+380930000001,ada@example.com,1815-12-10\n"
+        "Alan,Turing,+380930000002,,\n"
+        "Bad,Phone,12,,\n"
+    )
+    response = client.post(
+        "api/v1/contacts/import",
+        content=body,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "text/csv",
+        },
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["created"] == 2
+    assert data["failed"] == 1
+    assert data["errors"][0]["line"] == 4
+    assert data["errors"][0]["errors"][0]["loc"] == ["phone"]
+
+
+def test_import_contacts_ndjson(client, token):
+    body = (
+        '{"first_name": "Grace", "last_name": "Hopper",'
+        ' "phone": "+380930000003"}\n'
+        "not json\n"
+    )
+    response = client.post(
+        "api/v1/contacts/import",
+        content=body,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/x-ndjson",
+        },
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (data["created"], data["failed"]) == (1, 1)
+    assert data["errors"][0]["line"] == 2
+
+    response = client.get(
+        "api/v1/contacts/?first_name=grace",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()[0]["last_name"] == "Hopper"
+
+
+@pytest.mark.parametrize(
+    "content_type, body, status_code",
+    [
+        ("application/json", "[]", 415),
+        ("text/csv", "first_name,nickname\nA,B\n", 400),
+        ("text/csv", b"first_name\n\xff\n", 400),
+    ],
+)
+def test_import_contacts_invalid(
+    client, token, content_type, body, status_code
+):
+    response = client.post(
+        "api/v1/contacts/import",
+        content=body,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": content_type,
+        },
+    )
+    assert response.status_code == status_code, response.text
+
+
+@pytest.mark.parametrize(
+    "format, media_type",
+    [
+        ("ndjson", "application/x-ndjson"),
+        ("csv", "text/csv"),
+        ("vcard", "text/vcard"),
+    ],
+)
+def test_export_contacts(client, token, format, media_type):
+    headers = {"Authorization": f"Bearer {token}"}
+    contacts = client.get("api/v1/contacts/", headers=headers).json()
+    response = client.get(
+        f"api/v1/contacts/export?format={format}", headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith(media_type)
+    assert "attachment" in response.headers["content-disposition"]
+    if format == "ndjson":
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == [c["id"] for c in contacts]
+    elif format == "csv":
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [int(row["id"]) for row in rows] == [c["id"] for c in contacts]
+        assert rows[0]["phone"] == contacts[0]["phone"]
+    else:
+        assert response.text.count("BEGIN:VCARD\r\n") == len(contacts)
+        assert f"N:{contact['last_name']};{contact['first_name']};;;" in (
+            response.text
+        )
+
+
+def test_batch_update_and_delete_contacts(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    ids = []
+    for first_name in ("BatchA", "BatchB"):
+        response = client.post(
+            "api/v1/contacts/",
+            json={**contact, "first_name": first_name},
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+
+    response = client.patch(
+        "api/v1/contacts/batch",
+        json={
+            "items": [
+                {"id": ids[0], "last_name": "Patched"},
+                {"id": ids[1], "email": None, "birthday": "2000-02-29"},
+                {"id": 10_000, "last_name": "Missing"},
+            ]
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    first, second = response.json()
+    assert (first["id"], first["last_name"]) == (ids[0], "Patched")
+    assert first["email"] == contact["email"]
+    assert (second["first_name"], second["last_name"]) == ("BatchB", "Klym")
+    assert (second["email"], second["birthday"]) == (None, "2000-02-29")
+
+    response = client.request(
+        "DELETE",
+        "api/v1/contacts/batch",
+        json={"ids": ids + [10_000]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert [item["id"] for item in response.json()] == ids
+    response = client.get(f"api/v1/contacts/{ids[0]}", headers=headers)
+    assert response.status_code == 404, response.text
+
+
+@pytest.mark.parametrize(
+    "method, body, status_code",
+    [
+        ("PATCH", {"items": [{"id": 1, "first_name": None}]}, 422),
+        ("PATCH", {"items": []}, 422),
+        ("PATCH", {"items": [{"id": 10_000, "last_name": "X"}]}, 404),
+        ("DELETE", {"ids": [10_000]}, 404),
+    ],
+)
+def test_batch_contacts_invalid(client, token, method, body, status_code):
+    response = client.request(
+        method,
+        "api/v1/contacts/batch",
+        json=body,
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == status_code, response.text
+
+
+def test_patch_contact(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact_id = client.get("api/v1/contacts/", headers=headers).json()[0][
+        "id"
+    ]
+    response = client.patch(
+        f"api/v1/contacts/{contact_id}",
+        json={"last_name": "Patched"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["last_name"] == "Patched"
+    assert data["first_name"] == contact["first_name"]
+    assert data["email"] == contact["email"]
+
+
+@pytest.mark.parametrize("method", ["PATCH", "DELETE"])
+def test_contact_not_found(client, token, method):
+    response = client.request(
+        method,
+        "api/v1/contacts/10000",
+        json={"last_name": "Missing"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == "Contact not found"
+
+
+def test_get_contact_etag(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact_id = client.get("api/v1/contacts/", headers=headers).json()[0][
+        "id"
+    ]
+    response = client.get(f"api/v1/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    tag = response.headers["etag"]
+
+    response = client.get(
+        f"api/v1/contacts/{contact_id}",
+        headers={**headers, "If-None-Match": tag},
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == tag
+    assert response.content == b""
+
+    response = client.patch(
+        f"api/v1/contacts/{contact_id}",
+        json={"first_name": "Etag"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] != tag
+    response = client.get(
+        f"api/v1/contacts/{contact_id}",
+        headers={**headers, "If-None-Match": tag},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["first_name"] == "Etag"
+
+
+def test_list_contacts_etag(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("api/v1/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    tag = response.headers["etag"]
+    contact_id = response.json()[0]["id"]
+
+    response = client.get(
+        "api/v1/contacts/", headers={**headers, "If-None-Match": tag}
+    )
+    assert response.status_code == 304
+
+    client.patch(
+        f"api/v1/contacts/{contact_id}",
+        json={"first_name": "Changed"},
+        headers=headers,
+    )
+    response = client.get(
+        "api/v1/contacts/", headers={**headers, "If-None-Match": tag}
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] != tag
+
+
+def test_update_contact_if_match(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("api/v1/contacts/", json=contact, headers=headers)
+    assert response.status_code == 201, response.text
+    contact_id = response.json()["id"]
+    tag = client.get(
+        f"api/v1/contacts/{contact_id}", headers=headers
+    ).headers["etag"]
+
+    response = client.put(
+        f"api/v1/contacts/{contact_id}",
+        json=contact,
+        headers={**headers, "If-Match": tag},
+    )
+    assert response.status_code == 200, response.text
+    new_tag = response.headers["etag"]
+
+    # a second writer still holding the old tag loses
+    for method in ("PUT", "DELETE"):
+        response = client.request(
+            method,
+            f"api/v1/contacts/{contact_id}",
+            json=contact,
+            headers={**headers, "If-Match": tag},
+        )
+        assert response.status_code == 412, response.text
+        assert response.headers["etag"] == new_tag
+
+    # If-Match compares strongly, a weak tag never matches
+    response = client.delete(
+        f"api/v1/contacts/{contact_id}",
+        headers={**headers, "If-Match": f"W/{new_tag}"},
+    )
+    assert response.status_code == 412, response.text
+
+    response = client.delete(
+        f"api/v1/contacts/{contact_id}",
+        headers={**headers, "If-Match": new_tag},
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_get_contact_cached(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact_id = client.get("api/v1/contacts/", headers=headers).json()[0][
+        "id"
+    ]
+    client.get(f"api/v1/contacts/{contact_id}", headers=headers)
+    hits = contact_cache.hits
+    response = client.get(f"api/v1/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert contact_cache.hits == hits + 1
+    cached = response.json()
+
+    response = client.patch(
+        f"api/v1/contacts/{contact_id}",
+        json={"last_name": "Uncached"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    response = client.get(f"api/v1/contacts/{contact_id}", headers=headers)
+    assert response.json() == {**cached, "last_name": "Uncached"}
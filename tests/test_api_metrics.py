@@ -0,0 +1,42 @@
+from unittest.mock import AsyncMock
+
+from src.conf.config import settings
+from src.database.models import User
+
+
+def test_read_metrics_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", False)
+    response = client.get("api/v1/metrics/")
+    assert response.status_code == 404, response.text
+
+
+def test_read_metrics_unauthenticated(client, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", True)
+    response = client.get("api/v1/metrics/")
+    assert response.status_code == 401, response.text
+
+
+def test_read_metrics(client, session, user, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", True)
+    monkeypatch.setattr("src.api.auth.send_email", AsyncMock())
+    client.post("api/v1/auth/signup", json=user)
+    current_user: User = (
+        session.query(User).filter(User.email == user["email"]).first()
+    )
+    current_user.confirmed = True
+    session.commit()
+    response = client.post(
+        "api/v1/auth/login",
+        data={"username": user["email"], "password": user["password"]},
+    )
+    token = response.json()["access_token"]
+
+    response = client.get(
+        "api/v1/metrics/", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert "wait_time" in data["db_pool"]
+    assert "timeouts" in data["db_pool"]
+    assert "queue_wait" in data["password_hashing"]
+    assert "hits" in data["contact_cache"]
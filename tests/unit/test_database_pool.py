@@ -0,0 +1,47 @@
+import unittest
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.db import InstrumentedQueuePool, pool_stats
+from src.services.metrics import Histogram
+from tests.conftest import ASYNC_SQLALCHEMY_DATABASE_URL
+
+
+class TestHistogram(unittest.TestCase):
+    def test_snapshot_is_cumulative(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 4)
+        self.assertEqual(
+            snapshot["buckets"], {"0.1": 1, "1": 3, "+Inf": 4}
+        )
+
+
+class TestInstrumentedQueuePool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(
+            ASYNC_SQLALCHEMY_DATABASE_URL,
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.1,
+        )
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_records_wait_time(self):
+        observed = pool_stats.wait_time.count
+        async with self.engine.connect():
+            pass
+        self.assertEqual(pool_stats.wait_time.count, observed + 1)
+
+    async def test_records_timeouts(self):
+        timeouts = pool_stats.timeouts
+        async with self.engine.connect():
+            with self.assertRaises(exc.TimeoutError):
+                await self.engine.connect().start()
+        self.assertEqual(pool_stats.timeouts, timeouts + 1)
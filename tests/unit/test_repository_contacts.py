@@ -1,22 +1,30 @@
 import unittest
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
 
 from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
 
-from src.database.models import Contact, User
+from src.database.models import Contact, User, phone_digits
 from src.repository.contacts import (
     create_contact,
+    create_contacts,
     delete_contact,
+    delete_contacts,
     get_contact,
-    get_contact_by_email,
-    get_contact_by_first_name,
-    get_contact_by_last_name,
     get_contacts,
     get_contacts_by_birthday,
+    get_contacts_page,
+    search_contacts,
     update_contact,
+    update_contacts,
 )
-from src.schemas.contacts import ContactModel
-from tests.conftest import base_session
+from src.schemas.contacts import (
+    ContactBatchPatch,
+    ContactModel,
+    ContactPatch,
+)
+from tests.conftest import base_async_session
 
 fake_contacts = [
     ContactModel(
@@ -25,9 +33,9 @@ fake_contacts = [
         phone="+380930644885",
         email="my@dog.com",
         birthday=datetime.strftime(
-            datetime.replace(datetime.now() - timedelta(days=8), year=1991),
+            datetime.replace(datetime.now() + timedelta(days=8), year=1992),
             "%Y-%m-%d",
-        ),  # Birthday is 8 days for testing get_contacts_by_birthday() func
+        ),  # Birthday is in 8 days for testing get_contacts_by_birthday() func
     ),
     ContactModel(
         first_name="Mat",
@@ -35,25 +43,26 @@ fake_contacts = [
         phone="+380930004885",
         email="programming@life.com",
         birthday=datetime.strftime(
-            datetime.replace(datetime.now() - timedelta(days=10), year=1970),
+            datetime.replace(datetime.now() + timedelta(days=10), year=1972),
             "%Y-%m-%d",
         ),  # Birthday is in 10 days for testing get_contacts_by_birthday()  func
     ),
 ]
 
 
-def populate_db(db, user):
+async def populate_db(db, user):
     for contact in fake_contacts:
         contact = Contact(**contact.model_dump())
         contact.user_id = user.id
         db.add(contact)
-    db.commit()
+    await db.commit()
 
 
 # @pytest.mark.usefixtures("db")
 class TestContacts(unittest.IsolatedAsyncioTestCase):
-    def setUp(self):
-        self.db = next(base_session())
+    async def asyncSetUp(self):
+        self.db_session = base_async_session()
+        self.db = await anext(self.db_session)
         self.user = User(id=1)
         self.contact = ContactModel(
             first_name="Maksym",
@@ -62,7 +71,10 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             email="test@example.com",
             birthday="1990-10-01",
         )
-        populate_db(self.db, self.user)
+        await populate_db(self.db, self.user)
+
+    async def asyncTearDown(self):
+        await self.db_session.aclose()
 
     async def test_get_contacts_empty(self):
         user_no_contacts = User(id=2)
@@ -79,6 +91,18 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(result, Contact)
         self.assertEqual(result.first_name, self.contact.first_name)
 
+    async def test_create_contacts(self):
+        invalidate = AsyncMock()
+        with patch(
+            "src.repository.contacts.contact_cache.invalidate", invalidate
+        ):
+            created = await create_contacts(
+                [self.contact, self.contact], user=self.user, db=self.db
+            )
+        self.assertEqual(created, 2)
+        # ids 1 and 2 belong to the populated contacts
+        invalidate.assert_awaited_once_with(self.user.id, 3, 4)
+
     async def test_get_contact(self):
         test_contact_id = 1
         result = await get_contact(
@@ -95,50 +119,94 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         )
         self.assertIsNone(result)
 
-    async def test_get_contact_by_first_name(self):
-        result = await get_contact_by_first_name(
-            first_name="John", user=self.user, db=self.db
+    async def test_get_contacts_page(self):
+        page, cursor = await get_contacts_page(
+            cursor=None, limit=1, user=self.user, db=self.db
         )
-        self.assertIsInstance(result, Contact)
-        self.assertEqual(result.first_name, "John")
-        self.assertEqual(result.user_id, self.user.id)
+        self.assertEqual([contact.id for contact in page], [1])
+        page, cursor = await get_contacts_page(
+            cursor=cursor, limit=1, user=self.user, db=self.db
+        )
+        self.assertEqual([contact.id for contact in page], [2])
+        self.assertIsNone(cursor)
 
-    async def test_get_contact_by_first_name_wrong(self):
-        wrong_first_name = "Wrong name"
-        result = await get_contact_by_first_name(
-            first_name=wrong_first_name, user=self.user, db=self.db
+    async def test_get_contacts_filters_and_sorting(self):
+        result = await get_contacts(
+            skip=0,
+            limit=10,
+            user=self.user,
+            db=self.db,
+            email="my@dog.com",
+            sort_by="last_name",
+        )
+        self.assertEqual([contact.first_name for contact in result], ["John"])
+        result = await get_contacts(
+            skip=0,
+            limit=10,
+            user=self.user,
+            db=self.db,
+            first_name="john",
+            last_name="dou",
         )
         self.assertIsNone(result)
 
-    async def test_get_contact_by_last_name(self):
-        test_last_name = "Wick"
-        result = await get_contact_by_last_name(
-            last_name=test_last_name, user=self.user, db=self.db
+    async def test_get_contacts_page_sorted(self):
+        page, cursor = await get_contacts_page(
+            cursor=None,
+            limit=1,
+            user=self.user,
+            db=self.db,
+            sort_by="last_name",
+        )
+        self.assertEqual([contact.last_name for contact in page], ["Dou"])
+        page, cursor = await get_contacts_page(
+            cursor=cursor,
+            limit=1,
+            user=self.user,
+            db=self.db,
+            sort_by="last_name",
+        )
+        self.assertEqual([contact.last_name for contact in page], ["Wick"])
+        self.assertIsNone(cursor)
+
+    async def test_get_contacts_page_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            await get_contacts_page(
+                cursor="eyJpZCI6ICIxIn0=", limit=1, user=self.user, db=self.db
+            )
+
+    async def test_search_contacts_by_prefix(self):
+        result = await search_contacts(
+            q="wi", skip=0, limit=10, user=self.user, db=self.db
         )
-        self.assertIsInstance(result, Contact)
-        self.assertEqual(result.last_name, test_last_name)
-        self.assertEqual(result.user_id, self.user.id)
+        self.assertEqual([contact.last_name for contact in result], ["Wick"])
 
-    async def test_get_contact_by_last_name_wrong(self):
-        wrong_last_name = "Wrong last name"
-        result = await get_contact_by_last_name(
-            last_name=wrong_last_name, user=self.user, db=self.db
+    async def test_search_contacts_by_phone_digits(self):
+        result = await search_contacts(
+            q="093 000", skip=0, limit=10, user=self.user, db=self.db
         )
-        self.assertIsNone(result)
+        self.assertEqual([contact.first_name for contact in result], ["Mat"])
 
-    async def test_get_contact_by_email(self):
-        test_email = "my@dog.com"
-        result = await get_contact_by_email(
-            email=test_email, user=self.user, db=self.db
+    def test_phone_digits_matches_index(self):
+        # bound constants would not match the index under generic plans
+        compiled = phone_digits(Contact.phone).compile(
+            dialect=postgresql.asyncpg.dialect()
         )
-        self.assertIsInstance(result, Contact)
-        self.assertEqual(result.email, test_email)
-        self.assertEqual(result.user_id, self.user.id)
+        self.assertEqual(compiled.params, {})
+        self.assertEqual(
+            str(compiled),
+            "replace(replace(contacts.phone, 'tel:', ''), '-', '')",
+        )
+
+    async def test_search_contacts_pagination(self):
+        result = await search_contacts(
+            q="+380", skip=1, limit=10, user=self.user, db=self.db
+        )
+        self.assertEqual([contact.first_name for contact in result], ["John"])
 
-    async def test_get_contact_by_email_wrong(self):
-        wrong_email = "Wrong email"
-        result = await get_contact_by_email(
-            email=wrong_email, user=self.user, db=self.db
+    async def test_search_contacts_wrong(self):
+        result = await search_contacts(
+            q="100%", skip=0, limit=10, user=self.user, db=self.db
         )
         self.assertIsNone(result)
 
@@ -157,6 +225,43 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         )
         self.assertIsNone(result)
 
+    async def test_get_contacts_by_birthday_soonest_first(self):
+        result = await get_contacts_by_birthday(
+            interval=30, user=self.user, db=self.db
+        )
+        self.assertEqual(
+            [contact.first_name for contact in result], ["John", "Mat"]
+        )
+
+    async def test_get_contacts_by_birthday_year_end(self):
+        birthdays = {
+            "Null": None,
+            "Leap": date(1992, 2, 29),
+            "December": date(1990, 12, 30),
+            "January": date(1990, 1, 2),
+        }
+        for first_name, birthday in birthdays.items():
+            body = self.contact.model_copy(
+                update={"first_name": first_name, "birthday": birthday}
+            )
+            await create_contact(body=body, user=self.user, db=self.db)
+
+        with patch("src.repository.contacts.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2025, 12, 28)
+            result = await get_contacts_by_birthday(
+                interval=7, user=self.user, db=self.db
+            )
+        self.assertEqual(
+            [contact.first_name for contact in result], ["December", "January"]
+        )
+
+        with patch("src.repository.contacts.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2025, 2, 27)
+            result = await get_contacts_by_birthday(
+                interval=2, user=self.user, db=self.db
+            )
+        self.assertEqual([contact.first_name for contact in result], ["Leap"])
+
     async def test_update_contact(self):
         test_contact_id = 1
         result = await update_contact(
@@ -184,13 +289,36 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         )
         self.assertIsNone(result)
 
+    async def test_patch_contact(self):
+        result = await update_contact(
+            body=ContactPatch(email=None, birthday="2001-03-04"),
+            contact_id=1,
+            user=self.user,
+            db=self.db,
+        )
+        self.assertEqual(result.id, 1)
+        self.assertEqual(result.first_name, "John")
+        self.assertIsNone(result.email)
+        self.assertEqual(result.birthday_md, 304)
+
+    async def test_patch_contact_wrong(self):
+        result = await update_contact(
+            body=ContactPatch(first_name="Nobody"),
+            contact_id=5,
+            user=self.user,
+            db=self.db,
+        )
+        self.assertIsNone(result)
+
     async def test_delete_contact(self):
         test_contact_id = 1
         result = await delete_contact(
             contact_id=test_contact_id, user=self.user, db=self.db
         )
-        check_delete = self.db.execute(
-            select(Contact).filter(Contact.id == test_contact_id)
+        check_delete = (
+            await self.db.execute(
+                select(Contact).filter(Contact.id == test_contact_id)
+            )
         ).scalar_one_or_none()
         self.assertEqual(result.id, test_contact_id)
         self.assertIsNone(check_delete)
@@ -201,3 +329,36 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             contact_id=test_contact_id, user=self.user, db=self.db
         )
         self.assertIsNone(result)
+
+    async def test_update_contacts(self):
+        result = await update_contacts(
+            patches=[
+                ContactBatchPatch(id=2, birthday="2000-12-31"),
+                ContactBatchPatch(id=1, first_name="Johnny"),
+            ],
+            user=self.user,
+            db=self.db,
+        )
+        self.assertEqual([contact.id for contact in result], [1, 2])
+        self.assertEqual(result[0].first_name, "Johnny")
+        self.assertEqual(result[0].last_name, "Wick")
+        self.assertEqual(result[1].birthday, date(2000, 12, 31))
+        self.assertEqual(result[1].birthday_md, 1231)
+
+    async def test_update_contacts_other_user(self):
+        result = await update_contacts(
+            patches=[ContactBatchPatch(id=1, first_name="Johnny")],
+            user=User(id=2),
+            db=self.db,
+        )
+        self.assertEqual(result, [])
+        contact = await get_contact(1, self.user, self.db)
+        self.assertEqual(contact.first_name, "John")
+
+    async def test_delete_contacts(self):
+        result = await delete_contacts(
+            ids=[1, 2, 25], user=self.user, db=self.db
+        )
+        self.assertEqual([contact.id for contact in result], [1, 2])
+        remaining = await get_contacts(0, 10, self.user, self.db)
+        self.assertIsNone(remaining)
@@ -7,11 +7,14 @@ from src.repository.users import (
     confirmed_email,
     create_user,
     get_user_by_email,
+    get_token_version,
+    revoke_tokens,
     update_token,
     update_avatar,
 )
 from src.schemas.users import UserModel
-from tests.conftest import base_session
+from src.services.cache import token_revocations
+from tests.conftest import base_async_session
 
 db_user = UserModel(
     username="metalhead",
@@ -20,22 +23,26 @@ db_user = UserModel(
 )
 
 
-def populate_db(user, db):
+async def populate_db(user, db):
     user = User(**user.model_dump())
     db.add(user)
-    db.commit()
+    await db.commit()
 
 
 class TestUsersRepo(unittest.IsolatedAsyncioTestCase):
-    def setUp(self):
+    async def asyncSetUp(self):
         self.db_user = UserModel(
             username="metalhead",
             email="metalhead@example.com",
             password="123456789",
         )
-        self.db = next(base_session())
+        self.db_session = base_async_session()
+        self.db = await anext(self.db_session)
         self.gravar_url_prefix = "https://www.gravatar.com/avatar/"
-        populate_db(self.db_user, self.db)
+        await populate_db(self.db_user, self.db)
+
+    async def asyncTearDown(self):
+        await self.db_session.aclose()
 
     async def test_create_user(self):
         test_user = UserModel(
@@ -75,26 +82,49 @@ class TestUsersRepo(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_token(self):
         test_token = "new token"
-        user = self.db.execute(
-            select(User).filter(User.email == self.db_user.email)
+        user = (
+            await self.db.execute(
+                select(User).filter(User.email == self.db_user.email)
+            )
         ).scalar_one()
         await update_token(user, test_token, self.db)
-        self.db.refresh(user)
+        await self.db.refresh(user)
         self.assertEqual(user.refresh_token, test_token)
 
     async def test_confirmed_email(self):
-        user = self.db.execute(
-            select(User).filter(User.email == self.db_user.email)
+        user = (
+            await self.db.execute(
+                select(User).filter(User.email == self.db_user.email)
+            )
         ).scalar_one()
         await confirmed_email(user.email, self.db)
-        self.db.refresh(user)
+        await self.db.refresh(user)
         self.assertTrue(user.confirmed)
 
     async def test_update_avatar(self):
         test_avatar = "new avatar"
-        user = self.db.execute(
-            select(User).filter(User.email == self.db_user.email)
+        user = (
+            await self.db.execute(
+                select(User).filter(User.email == self.db_user.email)
+            )
         ).scalar_one()
-        await update_avatar(user.email, test_avatar, self.db)
-        self.db.refresh(user)
+        result = await update_avatar(user.email, test_avatar, self.db)
+        self.assertIs(result, user)
         self.assertEqual(user.avatar, test_avatar)
+
+    async def test_revoke_tokens(self):
+        user = (
+            await self.db.execute(
+                select(User).filter(User.email == self.db_user.email)
+            )
+        ).scalar_one()
+        await update_token(user, "refresh token", self.db)
+        version = await revoke_tokens(user, self.db)
+        await self.db.refresh(user)
+        self.assertEqual(version, 1)
+        self.assertEqual(user.token_version, 1)
+        self.assertIsNone(user.refresh_token)
+        self.assertTrue(token_revocations.is_revoked(user.id, 0))
+        self.assertFalse(token_revocations.is_revoked(user.id, 1))
+        self.assertEqual(await get_token_version(user.id, self.db), 1)
+        self.assertIsNone(await get_token_version(user.id + 1, self.db))
@@ -0,0 +1,31 @@
+import unittest
+from unittest.mock import patch
+
+from jose import JWTError, jwt
+
+from src.services.auth import auth_service
+from src.services.cache import token_cache
+
+
+class TestDecodeToken(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        token_cache.local.clear()
+        self.token = await auth_service.create_access_token(
+            data={"sub": "cached@example.com"}
+        )
+
+    async def test_verifies_once(self):
+        with patch(
+            "src.services.auth.jwt.decode", wraps=jwt.decode
+        ) as decode:
+            for _ in range(3):
+                payload = auth_service.decode_token(self.token)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(payload["sub"], "cached@example.com")
+
+    async def test_tampered_token_is_not_served_from_cache(self):
+        auth_service.decode_token(self.token)
+        header, payload, signature = self.token.split(".")
+        tampered = ".".join((header, payload, signature[::-1]))
+        with self.assertRaises(JWTError):
+            auth_service.decode_token(tampered)
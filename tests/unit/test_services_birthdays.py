@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.services import birthdays
+from src.services.cache import birthday_cache
+
+
+@asynccontextmanager
+async def fake_session():
+    yield None
+
+
+class TestRunDaily(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.lock = f"birthdays:job:{date.today().isoformat()}"
+        await self.r.delete(self.lock)
+        birthday_cache.r = self.r
+
+    async def asyncTearDown(self):
+        birthday_cache.r = None
+        await self.r.delete(self.lock)
+        await self.r.close()
+
+    async def test_failed_run_is_retried(self):
+        precompute = AsyncMock(side_effect=[RuntimeError("db down"), 3])
+        # the backoff returns, the sleep until midnight ends the loop
+        sleep = AsyncMock(side_effect=[None, asyncio.CancelledError])
+        with (
+            patch.object(birthdays, "precompute_birthday_digests", precompute),
+            patch.object(birthdays, "SessionLocal", fake_session),
+            patch.object(birthdays.asyncio, "sleep", sleep),
+            self.assertLogs(birthdays.logger) as logs,
+        ):
+            with self.assertRaises(asyncio.CancelledError):
+                await birthdays.run_daily()
+        self.assertEqual(precompute.await_count, 2)
+        self.assertEqual(sleep.await_args_list[0].args, (60,))
+        self.assertIn("db down", logs.output[0])
+        self.assertGreater(await self.r.ttl(self.lock), birthdays.LOCK_TTL)
@@ -0,0 +1,333 @@
+import asyncio
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.database.models import Contact
+from src.schemas.users import Principal
+from src.services.cache import (
+    MISS,
+    PENDING,
+    BirthdayCache,
+    ContactCache,
+    Idempotency,
+    LRUCache,
+    TokenCache,
+    TokenRevocations,
+    UserCache,
+    dumps_principal,
+    loads_principal,
+)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_expires_entries(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        with patch("src.services.cache.time.monotonic", return_value=0):
+            cache.set("a", 1)
+        with patch("src.services.cache.time.monotonic", return_value=61):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestPrincipalSerialization(unittest.TestCase):
+    def test_round_trip(self):
+        principal = Principal(1, "a@example.com", "alice", True, None)
+        data = dumps_principal(principal)
+        self.assertEqual(loads_principal(data), principal)
+
+    def test_round_trip_unknown_user(self):
+        self.assertIsNone(loads_principal(dumps_principal(None)))
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.worker = UserCache(
+            maxsize=10, local_ttl=60, ttl=60, negative_ttl=5
+        )
+        self.other_worker = UserCache(
+            maxsize=10, local_ttl=60, ttl=60, negative_ttl=5
+        )
+        self.worker.r = self.other_worker.r = self.r
+        self.email = "cached@example.com"
+        await self.r.delete(self.worker.key(self.email))
+        self.listener = asyncio.create_task(self.worker.listen())
+
+    async def asyncTearDown(self):
+        self.listener.cancel()
+        await self.r.close()
+
+    async def test_invalidate_evicts_other_workers(self):
+        email = self.email
+        principal = Principal(1, email, "cached", True, None)
+        await self.worker.set(email, principal)
+        self.assertEqual(await self.other_worker.get(email), principal)
+        await asyncio.sleep(0.1)  # let the listener subscribe
+
+        await self.other_worker.invalidate(email)
+
+        for _ in range(50):
+            if self.worker.local.get(email, MISS) is MISS:
+                break
+            await asyncio.sleep(0.01)
+        self.assertIs(self.worker.local.get(email, MISS), MISS)
+        self.assertIs(await self.worker.get(email), MISS)
+
+    async def test_get_or_load_single_flight(self):
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return Principal(1, self.email, "cached", True, None)
+
+        results = await asyncio.gather(
+            *(self.worker.get_or_load(self.email, loader) for _ in range(20))
+        )
+        self.assertEqual(calls, 1)
+        self.assertEqual(len(set(results)), 1)
+
+    async def test_get_or_load_caches_unknown_user(self):
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+
+        self.assertIsNone(await self.worker.get_or_load(self.email, loader))
+        self.assertIsNone(
+            await self.other_worker.get_or_load(self.email, loader)
+        )
+        self.assertEqual(calls, 1)
+        self.assertLessEqual(await self.r.ttl(self.worker.key(self.email)), 5)
+
+
+class TestBirthdayCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.cache = BirthdayCache(ttl=60)
+        self.cache.r = self.r
+        self.today = date.today()
+        await self.r.delete(
+            self.cache.key(1, self.today), self.cache.generation_key(1)
+        )
+
+    async def asyncTearDown(self):
+        await self.r.close()
+
+    async def test_set_get_per_interval(self):
+        await self.cache.set(1, 7, self.today, b"[1]", 0)
+        await self.cache.set(1, 30, self.today, b"[1,2]", 0)
+        self.assertEqual(await self.cache.get(1, 7, self.today), b"[1]")
+        self.assertEqual(await self.cache.get(1, 30, self.today), b"[1,2]")
+        self.assertIsNone(await self.cache.get(1, 14, self.today))
+        key = self.cache.key(1, self.today)
+        self.assertLessEqual(await self.r.ttl(key), 60)
+
+    async def test_invalidate_drops_all_intervals(self):
+        await self.cache.set(1, 7, self.today, b"[]", 0)
+        await self.cache.set(1, 30, self.today, b"[]", 0)
+        await self.cache.invalidate(1)
+        self.assertIsNone(await self.cache.get(1, 7, self.today))
+        self.assertIsNone(await self.cache.get(1, 30, self.today))
+
+    async def test_fill_racing_a_write_is_dropped(self):
+        generation = await self.cache.generation(1)
+        # a contact write commits after the fill read the old list
+        await self.cache.invalidate(1)
+        stored = await self.cache.set(1, 7, self.today, b"[]", generation)
+        self.assertFalse(stored)
+        self.assertIsNone(await self.cache.get(1, 7, self.today))
+        generation = await self.cache.generation(1)
+        self.assertTrue(
+            await self.cache.set(1, 7, self.today, b"[]", generation)
+        )
+
+    async def test_without_redis(self):
+        self.cache.r = None
+        await self.cache.set(1, 7, self.today, b"[]", 0)
+        self.assertIsNone(await self.cache.get(1, 7, self.today))
+        await self.cache.invalidate(1)
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.cache = ContactCache(ttl=60)
+        self.cache.r = self.r
+        self.contact = Contact(
+            id=7,
+            first_name="John",
+            last_name="Wick",
+            phone="tel:+380-93-064-4885",
+            email=None,
+            birthday=date(1964, 9, 2),
+            version=3,
+            user_id=1,
+        )
+        await self.r.delete(
+            self.cache.key(1, 7), self.cache.generation_key(1)
+        )
+
+    async def asyncTearDown(self):
+        await self.r.close()
+
+    async def test_round_trip_and_counters(self):
+        self.assertIsNone(await self.cache.get(1, 7))
+        await self.cache.set(self.contact, 0)
+        cached = await self.cache.get(1, 7)
+        self.assertEqual(
+            (cached.id, cached.birthday, cached.version, cached.user_id),
+            (7, date(1964, 9, 2), 3, 1),
+        )
+        self.assertIsNone(await self.cache.get(2, 7))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertLessEqual(await self.r.ttl(self.cache.key(1, 7)), 60)
+
+    async def test_invalidate(self):
+        await self.cache.set(self.contact, 0)
+        await self.cache.invalidate(1, 7, 8)
+        self.assertIsNone(await self.cache.get(1, 7))
+
+    async def test_fill_racing_a_write_is_dropped(self):
+        generation = await self.cache.generation(1)
+        # the contact is updated after the fill read the old row
+        await self.cache.invalidate(1, 7)
+        self.assertFalse(await self.cache.set(self.contact, generation))
+        self.assertIsNone(await self.cache.get(1, 7))
+
+    async def test_disabled(self):
+        self.cache.enabled = False
+        await self.cache.set(self.contact, 0)
+        self.assertIsNone(await self.cache.get(1, 7))
+        self.assertEqual(self.cache.misses, 0)
+
+
+class TestTokenCache(unittest.TestCase):
+    def test_expires_with_token(self):
+        cache = TokenCache(maxsize=10)
+        key = cache.key("header.payload.signature")
+        with patch("src.services.cache.time.time", return_value=1000):
+            cache.set(key, {"sub": "a@example.com", "exp": 1060})
+        with patch("src.services.cache.time.monotonic", return_value=0):
+            self.assertIsNone(cache.get(cache.key("other.token")))
+        self.assertEqual(cache.get(key)["sub"], "a@example.com")
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_skips_expired_token(self):
+        cache = TokenCache(maxsize=10)
+        key = cache.key("header.payload.signature")
+        with patch("src.services.cache.time.time", return_value=1000):
+            cache.set(key, {"sub": "a@example.com", "exp": 999})
+        self.assertEqual(len(cache.local), 0)
+
+
+class TestTokenRevocations(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.worker = TokenRevocations(ttl=60)
+        self.other_worker = TokenRevocations(ttl=60)
+        self.worker.r = self.other_worker.r = self.r
+        await self.r.delete(self.worker.key(7), self.worker.key(8))
+
+    async def asyncTearDown(self):
+        await self.r.close()
+
+    async def test_expires_with_tokens(self):
+        with patch("src.services.cache.time.monotonic", return_value=0):
+            await self.worker.revoke(7, 2)
+            self.assertTrue(self.worker.is_revoked(7, 1))
+            self.assertFalse(self.worker.is_revoked(7, 2))
+        with patch("src.services.cache.time.monotonic", return_value=61):
+            self.assertFalse(self.worker.is_revoked(7, 1))
+        self.assertNotIn(7, self.worker.local)
+
+    async def test_shared_with_other_workers(self):
+        await self.other_worker.revoke(7, 1)
+        self.assertFalse(self.worker.synced)
+        listener = asyncio.create_task(self.worker.listen())
+        try:
+            await asyncio.sleep(0.1)  # let the listener subscribe and load
+            self.assertTrue(self.worker.synced)
+            self.assertTrue(self.worker.is_revoked(7, 0))
+            await self.other_worker.revoke(8, 3)
+            for _ in range(50):
+                if self.worker.is_revoked(8, 2):
+                    break
+                await asyncio.sleep(0.01)
+            self.assertTrue(self.worker.is_revoked(8, 2))
+        finally:
+            listener.cancel()
+
+
+class TestIdempotency(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        self.store = Idempotency("test", ttl=60)
+        self.store.r = self.r
+        await self.r.delete(self.store.key("a"))
+        self.calls = 0
+
+    async def asyncTearDown(self):
+        await self.r.close()
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {"calls": self.calls}
+
+    async def test_replays_result(self):
+        first = await self.store.run("a", self.call, fingerprint="x")
+        again = await self.store.run("a", self.call, fingerprint="x")
+        self.assertEqual(first, again)
+        self.assertEqual(self.calls, 1)
+        with self.assertRaises(ValueError):
+            await self.store.run("a", self.call, fingerprint="y")
+
+    async def test_pending_while_running(self):
+        results = await asyncio.gather(
+            self.store.run("a", self.call), self.store.run("a", self.call)
+        )
+        self.assertEqual(results, [{"calls": 1}, PENDING])
+
+    async def test_claims_key_expired_after_set(self):
+        get = self.r.get
+        expired = False
+
+        async def get_after_expiry(key):
+            # the holder's key expires between SET NX and GET once
+            nonlocal expired
+            if not expired:
+                expired = True
+                await self.r.delete(key)
+            return await get(key)
+
+        await self.r.set(self.store.key("a"), b'{"fingerprint": ""}')
+        with patch.object(self.r, "get", get_after_expiry):
+            self.assertEqual(
+                await self.store.run("a", self.call), {"calls": 1}
+            )
+        self.assertEqual(await self.store.run("a", self.call), {"calls": 1})
+
+    async def test_failure_releases_key(self):
+        async def fail():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            await self.store.run("a", fail)
+        self.assertEqual(await self.store.run("a", self.call), {"calls": 1})
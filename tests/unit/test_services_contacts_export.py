@@ -0,0 +1,56 @@
+import unittest
+from collections import namedtuple
+from datetime import date
+
+from src.services.contacts_export import to_csv, vcard, vcard_line
+
+Row = namedtuple(
+    "Row", ["id", "first_name", "last_name", "phone", "email", "birthday"]
+)
+
+
+async def chunks(*partitions):
+    for rows in partitions:
+        yield rows
+
+
+class TestContactsExport(unittest.IsolatedAsyncioTestCase):
+    def test_vcard_escapes_and_folds(self):
+        row = Row(
+            id=1,
+            first_name="Jo;hn",
+            last_name="W" * 80,
+            phone="tel:+380-93-064-4885",
+            email=None,
+            birthday=date(1992, 1, 2),
+        )
+        card = vcard(row)
+        self.assertIn("N:" + "W" * 73 + "\r\n " + "W" * 7 + ";Jo\\;hn", card)
+        self.assertIn("TEL;TYPE=CELL:+380-93-064-4885\r\n", card)
+        self.assertIn("BDAY:1992-01-02\r\n", card)
+        self.assertNotIn("EMAIL", card)
+
+    def test_vcard_folds_octets(self):
+        for line in ("W" * 200, "N:" + "Є" * 100, "FN:" + "a" + "😀" * 40):
+            folded = vcard_line(line)
+            physical = folded.removesuffix("\r\n").split("\r\n")
+            self.assertTrue(
+                all(len(part.encode()) <= 75 for part in physical)
+            )
+            self.assertTrue(
+                all(part.startswith(" ") for part in physical[1:])
+            )
+            self.assertEqual(folded.replace("\r\n ", ""), line + "\r\n")
+
+    async def test_csv_one_chunk_per_partition(self):
+        rows = [Row(i, "A", "B", "tel:+1", None, None) for i in range(3)]
+        out = [chunk async for chunk in to_csv(chunks(rows[:2], rows[2:]))]
+        self.assertEqual(len(out), 2)
+        self.assertTrue(out[0].startswith(b"id,first_name,"))
+        self.assertEqual(out[1], b"2,A,B,tel:+1,,\r\n")
+
+    async def test_csv_header_without_contacts(self):
+        out = [chunk async for chunk in to_csv(chunks())]
+        self.assertEqual(
+            out, [b"id,first_name,last_name,phone,email,birthday\r\n"]
+        )
@@ -0,0 +1,106 @@
+import unittest
+
+from src.services.contacts_import import (
+    iter_csv_rows,
+    iter_lines,
+    parse_csv,
+    parse_ndjson,
+)
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class TestContactsImportParsing(unittest.IsolatedAsyncioTestCase):
+    async def test_iter_lines_across_chunks(self):
+        chunks = stream(b"\xef\xbb\xbfa,b\nc", b",d\r", b"\ne\xc3", b"\xa9")
+        lines = await collect(iter_lines(chunks))
+        self.assertEqual(
+            lines, [(1, "a,b\n"), (2, "c,d\r\n"), (3, "eé")]
+        )
+
+    async def test_iter_lines_invalid_utf8(self):
+        with self.assertRaises(UnicodeDecodeError):
+            await collect(iter_lines(stream(b"a\n\xff\n")))
+
+    async def test_iter_lines_too_long(self):
+        chunks = stream(b"ab", b"cdef", b"gh\nij\n", b"x" * 10)
+        lines = await collect(iter_lines(chunks, max_line_size=5))
+        self.assertEqual(lines, [(1, None), (2, "ij\n"), (3, None)])
+
+    async def test_csv_line_too_long(self):
+        body = b'a,"b\n' + b"x" * 200 + b'"\nc\n'
+        rows = await collect(
+            iter_csv_rows(
+                iter_lines(stream(body), max_line_size=100),
+                max_record_size=100,
+            )
+        )
+        self.assertEqual(rows, [(1, "Record too large"), (3, ["c"])])
+
+    async def test_csv_record_with_line_break(self):
+        rows = await collect(
+            iter_csv_rows(iter_lines(stream(b'x\n"multi\nline",y\nz\n')))
+        )
+        self.assertEqual(
+            rows, [(1, ["x"]), (2, ["multi\nline", "y"]), (4, ["z"])]
+        )
+
+    async def test_csv_quote_inside_unquoted_field(self):
+        body = (
+            b"John,O\"Brien,+380936644885\n"
+            b"Ada,Lovelace,+380936644886\n"
+            b"Alan,Turing,+380936644887\n"
+        )
+        rows = await collect(iter_csv_rows(iter_lines(stream(body))))
+        self.assertEqual(
+            [(number, row[1]) for number, row in rows],
+            [(1, 'O"Brien'), (2, "Lovelace"), (3, "Turing")],
+        )
+
+    async def test_csv_record_across_read_ahead(self):
+        lines = [f"{i},row\n".encode() for i in range(300)]
+        lines[255] = b'255,"multi\n'
+        lines[256] = b'line"\n'
+        rows = await collect(iter_csv_rows(iter_lines(stream(*lines))))
+        self.assertEqual(rows[255], (256, ["255", "multi\nline"]))
+        self.assertEqual(rows[256], (258, ["257", "row"]))
+        self.assertEqual(len(rows), 299)
+
+    async def test_csv_record_too_large(self):
+        body = b'a,"never closed\n' + b"x\n" * 1000
+        rows = await collect(
+            iter_csv_rows(iter_lines(stream(body)), max_record_size=100)
+        )
+        self.assertEqual(rows[0], (1, "Record too large"))
+        # parsing resumes after the skipped lines
+        self.assertEqual(rows[1], (257, ["x"]))
+
+    def test_parse_csv(self):
+        rows = list(
+            parse_csv(
+                ["first_name", "email"],
+                [
+                    (2, ["Ada", ""]),
+                    (3, []),
+                    (4, ["only"]),
+                    (5, "Invalid CSV: boom"),
+                ],
+            )
+        )
+        self.assertEqual(rows[0], (2, {"first_name": "Ada", "email": None}))
+        self.assertEqual(rows[1][0], 4)
+        self.assertIsInstance(rows[1][1], str)
+        self.assertEqual(rows[2], (5, "Invalid CSV: boom"))
+
+    def test_parse_ndjson_too_long(self):
+        rows = list(parse_ndjson([(1, None), (2, '{"first_name": "Ada"}')]))
+        self.assertEqual(
+            rows, [(1, "Record too large"), (2, {"first_name": "Ada"})]
+        )
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import aiosmtplib
+import orjson
+from redis.asyncio import Redis
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.email import (
+    TEMPLATE_FOLDER,
+    EmailQueue,
+    TemplateRegistry,
+    build_message,
+    send_email,
+)
+from src.services.email_worker import EmailWorker, SMTPPool
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class FakePool:
+    """Records sent messages, failing the first ``failures`` sends."""
+
+    def __init__(self, failures=0, delay=0):
+        self.failures = failures
+        self.delay = delay
+        self.sent = []
+
+    async def send(self, message):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise aiosmtplib.SMTPServerDisconnected("gone")
+        self.sent.append(message)
+
+
+class TestBuildMessage(unittest.TestCase):
+    def test_renders_template(self):
+        message = build_message({
+            "template": "email_template.html",
+            "subject": "Confirm your email ",
+            "email": "deadpool@example.com",
+            "username": "<deadpool>",
+            "host": "http://test/",
+        })
+        self.assertEqual(message["To"], "deadpool@example.com")
+        html = message.get_content()
+        self.assertIn("Hi &lt;deadpool&gt;,", html)
+        token = html.split("confirmed_email/")[1].split('"')[0]
+        self.assertEqual(
+            auth_service.decode_token(token)["sub"], "deadpool@example.com"
+        )
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = Path(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_static_parts_match_jinja(self):
+        registry = TemplateRegistry(TEMPLATE_FOLDER)
+        registry.load()
+        template, parts, _ = registry.compiled["email_template.html"]
+        self.assertIsNotNone(parts)
+        context = {"host": "http://t/", "username": "<b>", "token": 1}
+        self.assertEqual(
+            registry.render("email_template.html", **context),
+            template.render(context),
+        )
+
+    def test_falls_back_to_jinja(self):
+        (self.path / "list.html").write_text(
+            "{% for name in names %}{{ name|upper }} {% endfor %}"
+        )
+        registry = TemplateRegistry(self.path)
+        self.assertEqual(
+            registry.render("list.html", names=["a", "b"]), "A B "
+        )
+        self.assertIsNone(registry.compiled["list.html"][1])
+
+    def test_reload(self):
+        template = self.path / "hello.txt"
+        template.write_text("Hi {{ name }}")
+        static = TemplateRegistry(self.path)
+        reloading = TemplateRegistry(self.path, reload=True)
+        for registry in static, reloading:
+            self.assertEqual(registry.render("hello.txt", name="a"), "Hi a")
+        template.write_text("Bye {{ name }}")
+        mtime = template.stat().st_mtime + 10
+        os.utime(template, (mtime, mtime))
+        self.assertEqual(static.render("hello.txt", name="a"), "Hi a")
+        self.assertEqual(reloading.render("hello.txt", name="a"), "Bye a")
+
+
+class TestEmailWorker(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.r = Redis(host=settings.redis_host, port=settings.redis_port)
+        # own keys, the suite may run against a Redis with real mail
+        self.queue = EmailQueue(
+            max_attempts=2, backoff=10, prefix="test:email"
+        )
+        self.queue.r = self.r
+        await self.r.delete(
+            self.queue.stream, self.queue.retries, self.queue.failed
+        )
+        await self.queue.create_group()
+
+    async def asyncTearDown(self):
+        await self.r.delete(
+            self.queue.stream, self.queue.retries, self.queue.failed
+        )
+        await self.r.close()
+
+    async def enqueue(self, count):
+        with patch("src.services.email.email_queue", self.queue):
+            for i in range(count):
+                await send_email(f"user{i}@example.com", "user", "http://t/")
+
+    async def test_delivers_batch(self):
+        await self.enqueue(3)
+        pool = FakePool()
+        worker = EmailWorker(self.queue, pool, "test", batch_size=2)
+        self.assertEqual(await worker.run_once(block=10), 2)
+        self.assertEqual(await worker.run_once(block=10), 1)
+        self.assertEqual(await worker.run_once(block=10), 0)
+        self.assertEqual(
+            [message["To"] for message in pool.sent],
+            [f"user{i}@example.com" for i in range(3)],
+        )
+        self.assertEqual(await self.r.xlen(self.queue.stream), 0)
+
+    async def test_retries_with_backoff(self):
+        await self.enqueue(1)
+        pool = FakePool(failures=2)
+        worker = EmailWorker(self.queue, pool, "test", batch_size=10)
+        with patch("src.services.email.time.time", return_value=1000):
+            await worker.run_once(block=10)
+        (data, due), = await self.r.zrange(
+            self.queue.retries, 0, -1, withscores=True
+        )
+        self.assertEqual(due, 1010)
+        self.assertEqual(orjson.loads(data)["attempt"], 1)
+        with patch("src.services.email.time.time", return_value=1005):
+            self.assertEqual(await worker.run_once(block=10), 0)
+        with patch("src.services.email.time.time", return_value=1010):
+            self.assertEqual(await worker.run_once(block=10), 1)
+        self.assertEqual(pool.sent, [])
+        failed = orjson.loads(await self.r.lindex(self.queue.failed, 0))
+        self.assertEqual(failed["attempt"], 1)
+        self.assertIn("gone", failed["error"])
+
+    async def test_claims_abandoned_jobs(self):
+        await self.enqueue(1)
+        self.queue.claim_idle = 0
+        await self.queue.read("crashed", 10, block=10)
+        pool = FakePool()
+        worker = EmailWorker(self.queue, pool, "test", batch_size=10)
+        self.assertEqual(await worker.run_once(block=10), 1)
+        self.assertEqual(len(pool.sent), 1)
+
+
+    async def test_keeps_slow_batch_claimed(self):
+        await self.enqueue(1)
+        self.queue.claim_idle = 300
+        pool = FakePool(delay=0.6)
+        worker = EmailWorker(self.queue, pool, "test", batch_size=10)
+        sending = asyncio.create_task(worker.run_once(block=10))
+        await asyncio.sleep(0.45)
+        self.assertEqual(await self.queue.read("other", 10, block=10), [])
+        self.assertEqual(await sending, 1)
+        self.assertEqual(len(pool.sent), 1)
+
+
+@unittest.skipUnless(Controller, "aiosmtpd is not installed")
+class TestSMTPPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.messages = []
+
+        class Handler:
+            async def handle_DATA(handler, server, session, envelope):
+                self.messages.append(session.peer)
+                return "250 OK"
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.controller = Controller(
+            Handler(), hostname="127.0.0.1", port=port
+        )
+        self.controller.start()
+        self.pool = SMTPPool(1, hostname="127.0.0.1", port=port)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.controller.stop()
+
+    async def test_reuses_connection(self):
+        jobs = [
+            {
+                "template": "email_template.html",
+                "subject": "Confirm your email ",
+                "email": f"user{i}@example.com",
+                "username": "user",
+                "host": "http://test/",
+            }
+            for i in range(3)
+        ]
+        await asyncio.gather(
+            *(self.pool.send(build_message(job)) for job in jobs)
+        )
+        self.assertEqual(len(self.messages), 3)
+        self.assertEqual(len(set(self.messages)), 1)
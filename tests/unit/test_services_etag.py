@@ -0,0 +1,28 @@
+import unittest
+
+from src.services.etag import (
+    collection_etag,
+    contact_etag,
+    etag_matches,
+    parse_versions,
+)
+
+
+class TestEtag(unittest.TestCase):
+    def test_etag_matches(self):
+        tag = contact_etag(3)
+        self.assertTrue(etag_matches(tag, tag))
+        self.assertTrue(etag_matches(f'"1", W/{tag}', tag))
+        self.assertTrue(etag_matches("*", tag))
+        self.assertFalse(etag_matches('"4"', tag))
+        self.assertFalse(etag_matches(None, tag))
+
+    def test_parse_versions(self):
+        self.assertEqual(parse_versions('"2", W/"5", "x", *'), [2])
+
+    def test_collection_etag_changes_with_members(self):
+        tag = collection_etag([(1, 1), (2, 1)], None)
+        self.assertEqual(tag, collection_etag([(1, 1), (2, 1)], None))
+        self.assertNotEqual(tag, collection_etag([(1, 1), (2, 2)], None))
+        self.assertNotEqual(tag, collection_etag([(1, 1)], None))
+        self.assertNotEqual(tag, collection_etag([(1, 1), (2, 1)], "next"))
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.hashing import HashingPool
+
+
+class TestHashingPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pool = HashingPool(workers=1, queue_size=1)
+
+    def tearDown(self):
+        self.pool.executor.shutdown()
+
+    async def test_run(self):
+        result = await self.pool.run(str.upper, "secret")
+        self.assertEqual(result, "SECRET")
+        self.assertEqual(self.pool.pending, 0)
+        self.assertEqual(self.pool.hash_time.count, 1)
+        self.assertEqual(self.pool.queue_wait.count, 1)
+
+    async def test_rejects_when_saturated(self):
+        release = threading.Event()
+        running = [
+            asyncio.create_task(self.pool.run(release.wait))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException) as cm:
+            await self.pool.run(release.wait)
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertEqual(self.pool.rejected, 1)
+
+        release.set()
+        await asyncio.gather(*running)
+        self.assertEqual(self.pool.pending, 0)
+
+    async def test_cancelled_callers_release_slots(self):
+        release = threading.Event()
+        running = asyncio.create_task(self.pool.run(release.wait))
+        queued = asyncio.create_task(self.pool.run(release.wait))
+        await asyncio.sleep(0)
+        self.assertEqual(self.pool.pending, 2)
+
+        # the queued job is dropped, the running one keeps its thread
+        running.cancel()
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.pool.pending, 1)
+
+        release.set()
+        for _ in range(100):
+            if not self.pool.pending:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.pool.pending, 0)
+        self.assertEqual(await self.pool.run(str.upper, "a"), "A")